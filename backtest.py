@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""Backtest the grid strategy on kline or trade history.
+
+Fill detection is vectorised with NumPy: the price path is mapped onto the grid
+lattice (reference price + k * priceStep) and every lattice level the path touches
+is found in one pass. Only the touched levels are then replayed through
+grid_core, which applies the same ladder, sizing and balance rules as grid.py.
+
+Fills assume the bot rebuilds the ladder before price reaches the next level, so a
+kline is walked open -> low -> high -> close (open -> high -> low -> close for a
+down candle) and every level crossed on the way can fill.
+"""
+
+import argparse
+import csv
+import sys
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import numpy as np
+
+import grid_core
+import ladder as ladder_engine
+
+DEFAULT_SYMBOL = 'BTCUSDT'
+KLINE_LIMIT = 1000
+
+
+def has_header(path):
+    with open(path, encoding='utf-8') as f:
+        first = f.readline().strip()
+    return bool(first) and not (first[0].isdigit() or first[0] == '-')
+
+
+def load_klines(path):
+    """Binance kline CSV: open time, open, high, low, close, ..."""
+    data = np.loadtxt(path, delimiter=',', usecols=(0, 1, 2, 3, 4), skiprows=int(has_header(path)), ndmin=2)
+    times, opens, highs, lows, closes = data.T
+    up = closes >= opens
+    path_prices = np.column_stack([opens, np.where(up, lows, highs), np.where(up, highs, lows), closes]).ravel()
+    return path_prices, np.repeat(times, 4)
+
+
+def load_trades(path):
+    """Binance trade CSV: id, price, qty, quoteQty, time, ..."""
+    data = np.loadtxt(path, delimiter=',', usecols=(1, 4), skiprows=int(has_header(path)), ndmin=2)
+    return data[:, 0], data[:, 1]
+
+
+def fetch_klines(symbol, interval, days, save_path):
+    """Download klines through the public REST API (see api_debug.py) into a CSV file."""
+    from api_debug import request_public
+
+    start = int((time.time() - days * 86400) * 1000)
+    rows = 0
+    with open(save_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        while True:
+            _, klines = request_public('/api/v3/klines', {
+                'symbol': symbol, 'interval': interval, 'startTime': start, 'limit': KLINE_LIMIT,
+            })
+            if not klines:
+                break
+            writer.writerows(klines)
+            rows += len(klines)
+            start = klines[-1][0] + 1
+            if len(klines) < KLINE_LIMIT:
+                break
+    print(f'Fetched {rows} {symbol} {interval} klines into {save_path}')
+
+
+def touched_levels(path_prices, refer_price, price_step):
+    """Lattice levels touched by the piecewise-linear price path, in order.
+
+    Level k is the price refer_price + k * price_step. Returns (levels, path index of the
+    segment that reached each level); consecutive repeats are removed and level 0, the
+    starting reference price, is always first.
+    """
+    x = (path_prices - refer_price) / price_step
+    start, end = x[:-1], x[1:]
+    up = end >= start
+    low = np.ceil(np.minimum(start, end)).astype(np.int64)
+    high = np.floor(np.maximum(start, end)).astype(np.int64)
+    counts = np.maximum(high - low + 1, 0)
+
+    segment = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    levels = np.where(up[segment], low[segment] + offsets, high[segment] - offsets)
+
+    levels = np.concatenate([[0], levels])
+    segment = np.concatenate([[0], segment + 1])
+    keep = np.concatenate([[True], np.diff(levels) != 0])
+    return levels[keep], segment[keep]
+
+
+def run_backtest(path_prices, times, params, filters, quote_balance, base_balance, fee_rate, refer_price=None):
+    """Replay touched lattice levels through grid_core and account fills, inventory, PnL and fees."""
+    if refer_price is None:
+        refer_price = grid_core.initial_refer_price(Decimal(repr(float(path_prices[0]))), params['priceStep'], filters['price_quantum'])
+    levels, segments = touched_levels(path_prices, float(refer_price), float(params['priceStep']))
+
+    state = {
+        'refer': refer_price, 'level': 0, 'lastSide': None, 'lastQty': Decimal('0'),
+        'quote': quote_balance, 'base': base_balance, 'avgCost': Decimal('0'),
+        'realized': Decimal('0'), 'fees': Decimal('0'), 'maxBase': base_balance,
+    }
+    fills = []
+
+    def plan():
+        return grid_core.plan_ladder(
+            params, filters, state['refer'], state['lastSide'], state['lastQty'],
+            state['quote'], state['base'], num_orders=1,
+        )
+
+    rungs = plan()
+    for level, segment in zip(levels.tolist(), segments.tolist()):
+        if level == state['level'] - 1 and rungs['buy']:
+            side, (price_ticks, qty_steps) = 'BUY', rungs['buy'][0]
+        elif level == state['level'] + 1 and rungs['sell']:
+            side, (price_ticks, qty_steps) = 'SELL', rungs['sell'][0]
+        else:
+            continue
+
+        price = ladder_engine.from_units(price_ticks, filters['price_quantum'])
+        qty = ladder_engine.from_units(qty_steps, filters['quantity_quantum'])
+        notional = price * qty
+        fee = notional * fee_rate
+        if side == 'BUY':
+            if state['base'] + qty > 0:
+                state['avgCost'] = (state['avgCost'] * state['base'] + notional) / (state['base'] + qty)
+            state['base'] += qty
+            state['quote'] -= notional + fee
+            state['maxBase'] = max(state['maxBase'], state['base'])
+        else:
+            state['realized'] += (price - state['avgCost']) * qty
+            state['base'] -= qty
+            state['quote'] += notional - fee
+        state['fees'] += fee
+        state['level'] = level
+        state['refer'] = grid_core.move_refer_price(state['refer'], side, params['priceStep'])
+        state['lastSide'], state['lastQty'] = side, qty
+        fills.append({
+            'time': int(times[segment]), 'side': side, 'price': price, 'qty': qty, 'fee': fee,
+            'base': state['base'], 'quote': state['quote'], 'realized': state['realized'] - state['fees'],
+        })
+        rungs = plan()
+
+    return state, fills, len(levels)
+
+
+def utc_ms_to_iso(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat()
+
+
+def write_fills(path, fills):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=['time', 'side', 'price', 'qty', 'fee', 'base', 'quote', 'realized'])
+        writer.writeheader()
+        writer.writerows(fills)
+
+
+def print_report(state, fills, touches, path_prices, times, initial_quote, initial_base, elapsed):
+    last_price = Decimal(repr(float(path_prices[-1])))
+    first_price = Decimal(repr(float(path_prices[0])))
+    buys = [fill for fill in fills if fill['side'] == 'BUY']
+    sells = [fill for fill in fills if fill['side'] == 'SELL']
+    unrealized = (last_price - state['avgCost']) * state['base']
+    start_equity = initial_quote + initial_base * first_price
+    end_equity = state['quote'] + state['base'] * last_price
+
+    print(f"Period:          {utc_ms_to_iso(times[0])} -> {utc_ms_to_iso(times[-1])}")
+    print(f"Path points:     {len(path_prices)}  levels touched: {touches}")
+    print(f"Fills:           {len(fills)} (buy {len(buys)}, sell {len(sells)})")
+    print(f"Volume:          buy {sum((fill['qty'] for fill in buys), Decimal('0'))}  sell {sum((fill['qty'] for fill in sells), Decimal('0'))}")
+    print(f"Inventory:       base {state['base']} (max {state['maxBase']}), quote {state['quote']:.2f}")
+    print(f"Average cost:    {state['avgCost']:.2f}  last price: {last_price}")
+    print(f"Realised PnL:    {state['realized']:.2f}  fees: {state['fees']:.2f}  net: {state['realized'] - state['fees']:.2f}")
+    print(f"Unrealised PnL:  {unrealized:.2f}")
+    print(f"Equity:          {start_equity:.2f} -> {end_equity:.2f}")
+    print(f"Elapsed:         {elapsed:.2f}s")
+
+
+def build_parser():
+    import grid
+
+    parser = argparse.ArgumentParser(description='Backtest the grid strategy on Binance kline or trade history.')
+    parser.add_argument('data', nargs='?', help='CSV file with Binance klines or trades')
+    parser.add_argument('--format', choices=['klines', 'trades'], default='klines', help='data file format, default: klines')
+    parser.add_argument('--fetch', action='store_true', help='download klines through the public API into the data file first')
+    parser.add_argument('--symbol', default=DEFAULT_SYMBOL, help=f'symbol to fetch, default: {DEFAULT_SYMBOL}')
+    parser.add_argument('--interval', default='1m', help='kline interval to fetch, default: 1m')
+    parser.add_argument('--days', type=float, default=30, help='days of history to fetch, default: 30')
+    parser.add_argument('--price-step', default=str(grid.priceStep))
+    parser.add_argument('--initial-buy-quantity', default=str(grid.initialBuyQuantity))
+    parser.add_argument('--buy-increment', default=str(grid.buyIncrement))
+    parser.add_argument('--sell-quantity', default=str(grid.sellQuantity))
+    parser.add_argument('--refer-price', help='starting reference price, within one price step of the first price; default: snapped from the first price')
+    parser.add_argument('--tick-size', default='0.01')
+    parser.add_argument('--step-size', default='0.00001')
+    parser.add_argument('--min-notional', default='5')
+    parser.add_argument('--quote-balance', default='10000', help='starting quote balance, default: 10000')
+    parser.add_argument('--base-balance', default='0', help='starting base balance, default: 0')
+    parser.add_argument('--fee-rate', default='0.001', help='fee rate charged in quote on every fill, default: 0.001')
+    parser.add_argument('--fills-csv', help='write every fill to this CSV file')
+    return parser
+
+
+def params_from_args(args):
+    params = {
+        'priceStep': Decimal(args.price_step),
+        'numOrders': 1,
+        'initialBuyQuantity': Decimal(args.initial_buy_quantity),
+        'buyIncrement': Decimal(args.buy_increment),
+        'sellQuantity': Decimal(args.sell_quantity),
+    }
+    filters = {
+        'price_quantum': Decimal(args.tick_size),
+        'quantity_quantum': Decimal(args.step_size),
+        'min_notional': Decimal(args.min_notional),
+    }
+    return params, filters
+
+
+def main():
+    args = build_parser().parse_args()
+    data_path = args.data or f'klines_{args.symbol}_{args.interval}.csv'
+    if args.fetch:
+        fetch_klines(args.symbol, args.interval, args.days, data_path)
+
+    started = time.perf_counter()
+    path_prices, times = load_klines(data_path) if args.format == 'klines' else load_trades(data_path)
+    if len(path_prices) < 2:
+        print(f'Not enough data in {data_path}', file=sys.stderr)
+        return 1
+
+    params, filters = params_from_args(args)
+    quote_balance = Decimal(args.quote_balance)
+    base_balance = Decimal(args.base_balance)
+    refer_price = Decimal(args.refer_price) if args.refer_price else None
+    if refer_price is not None and abs(refer_price - Decimal(repr(float(path_prices[0])))) > params['priceStep']:
+        # The first fill is found by lattice touches around the reference price; one too far
+        # from the market would silently skip trades until price came back to it
+        print(f'--refer-price {refer_price} is more than one step ({params["priceStep"]}) away from the '
+              f'first price {float(path_prices[0])}', file=sys.stderr)
+        return 2
+    state, fills, touches = run_backtest(
+        path_prices, times, params, filters, quote_balance, base_balance, Decimal(args.fee_rate), refer_price,
+    )
+    print_report(state, fills, touches, path_prices, times, quote_balance, base_balance, time.perf_counter() - started)
+    if args.fills_csv:
+        write_fills(args.fills_csv, fills)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""Fill-to-replace latency benchmark for grid.py.
+
+Each scenario runs in a fresh process: an in-process exchange_sim exchange (with
+optional response latency) serves REST and the WebSocket API, grid.py trades
+against it, and the benchmark moves the price to fill bursts of rungs. grid.py
+reports stage timestamps through its latency_trace_hook, and every fill is split
+into:
+
+    receipt    fill emitted by the exchange -> handle_websocket_message
+    queueing   handle_websocket_message -> update_orders picks the event up
+               (includes grid.py's fill batching window, see --fill-batch-ms)
+    decision   update_orders start -> ladder planned and diffed
+    placement  diff -> all cancels and replacement orders acknowledged
+    total      fill emitted -> replacements acknowledged
+
+Results can be saved as a JSON baseline and later runs compared against it.
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from multiprocessing import get_context
+
+STAGES = ['receipt', 'queueing', 'decision', 'placement', 'total']
+BENCH_RATE_LIMITS = [
+    {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': 10 ** 7},
+    {'rateLimitType': 'ORDERS', 'interval': 'SECOND', 'intervalNum': 10, 'limit': 10 ** 7},
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until(condition, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if condition():
+            return True
+        time.sleep(0.002)
+    return False
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples):
+    values = sorted(samples)
+    if not values:
+        return None
+    return {
+        'p50': round(percentile(values, 0.5) * 1000, 3),
+        'p99': round(percentile(values, 0.99) * 1000, 3),
+        'max': round(values[-1] * 1000, 3),
+    }
+
+
+class LatencyRecorder:
+    """Collects exchange fill times and grid.py stage timestamps (time.perf_counter, same process)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.emitted = {}
+        self.received = {}
+        self.updates = []
+        self.current = {}
+
+    def on_exchange_event(self, event):
+        if event.get('e') == 'executionReport' and event.get('x') == 'TRADE':
+            with self.lock:
+                self.emitted[event['i']] = time.perf_counter()
+
+    def on_trace(self, stage, pair, order_ids, timestamp):
+        with self.lock:
+            if stage == 'received':
+                for order_id in order_ids:
+                    self.received.setdefault(order_id, timestamp)
+            elif stage == 'update_start':
+                self.current[pair] = {'start': timestamp, 'orderIds': set(order_ids)}
+                self.updates.append(self.current[pair])
+            elif pair in self.current:
+                self.current[pair][stage] = timestamp
+
+    def completed_update(self, order_id):
+        with self.lock:
+            return next((update for update in self.updates if order_id in update['orderIds'] and 'placed' in update), None)
+
+    def samples(self, order_id):
+        update = self.completed_update(order_id)
+        emitted, received = self.emitted.get(order_id), self.received.get(order_id)
+        if update is None or emitted is None or received is None:
+            return None
+        return {
+            'receipt': received - emitted,
+            'queueing': update['start'] - received,
+            'decision': update['decided'] - update['start'],
+            'placement': update['placed'] - update['decided'],
+            'total': update['placed'] - emitted,
+        }
+
+
+def run_scenario(scenario):
+    """Run one scenario in this (fresh) process and return its per-stage samples in seconds."""
+    os.chdir(tempfile.mkdtemp(prefix='bench_latency_'))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import exchange_sim
+
+    rest_port, ws_port = free_port(), free_port()
+    os.environ['BINANCE_REST_URL'] = f'http://127.0.0.1:{rest_port}'
+    os.environ['BINANCE_WS_API_URL'] = f'ws://127.0.0.1:{ws_port}'
+    os.environ['BINANCE_STREAM_URL'] = f'ws://127.0.0.1:{ws_port}'
+    os.environ.setdefault('API_KEY', 'bench')
+    os.environ.setdefault('API_SECRET', 'bench')
+    import grid
+
+    config = dict(grid.gridConfigs[0], numOrders=scenario['numOrders'])
+    symbol = config['baseAsset'] + config['quoteAsset']
+    price_step = Decimal(str(config['priceStep']))
+    start_price = Decimal(scenario['price'])
+    exchange = exchange_sim.Exchange(
+        symbol, config['baseAsset'], config['quoteAsset'],
+        {config['baseAsset']: scenario['baseBalance'], config['quoteAsset']: scenario['quoteBalance']},
+        scenario['tickSize'], scenario['stepSize'], scenario['minNotional'], '0.001', rate_limits=BENCH_RATE_LIMITS,
+    )
+    exchange.on_price(start_price)
+    exchange.seed_trade('BUY', start_price, Decimal(str(config['initialBuyQuantity'])))
+    recorder = LatencyRecorder()
+    exchange.listeners.append(recorder.on_exchange_event)
+    exchange_sim.start_in_background(
+        exchange, '127.0.0.1', rest_port, ws_port, scenario['latencyMs'] / 1000, scenario['reportDelayMs'] / 1000,
+    )
+
+    grid.gridConfigs = [config]
+    grid.tradingEnabled = True
+    grid.telegramEnabled = False
+    grid.runtimeMode = scenario['runtime']
+    grid.speculativeOrders = scenario['speculative']
+    grid.restReconcileInterval = 24 * 60 * 60
+    grid.sd_notify = lambda state: None  # not running under systemd
+    grid.latency_trace_hook = recorder.on_trace
+    if scenario['fillBatchMs'] is not None:
+        grid.fillBatchWindow = scenario['fillBatchMs'] / 1000
+
+    num_orders = scenario['numOrders']
+    samples = {stage: [] for stage in STAGES}
+    incomplete = 0
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        threading.Thread(target=grid.main, daemon=True).start()
+
+        def ladder_ready():
+            return bool(grid.grids) and len(grid.grids[0].buy_orders) == num_orders and len(grid.grids[0].sell_orders) == num_orders
+
+        if not wait_until(ladder_ready, scenario['timeout']):
+            return {'error': 'initial ladder was not placed', 'samples': samples, 'incomplete': 0}
+
+        for round_index in range(scenario['rounds']):
+            refer_price = grid.grids[0].last_refer_price
+            direction = -1 if round_index % 2 == 0 else 1
+            before = set(recorder.emitted)
+            # Overshoot by half a step so every filled rung is traded through, not just touched
+            exchange.on_price(refer_price + direction * (scenario['burst'] * price_step + price_step / 2))
+            filled = set(recorder.emitted) - before
+            done = wait_until(
+                lambda: all(recorder.completed_update(order_id) for order_id in filled) and ladder_ready(),
+                scenario['timeout'],
+            )
+            for order_id in filled:
+                fill_samples = recorder.samples(order_id)
+                if fill_samples is None:
+                    incomplete += 1
+                    continue
+                for stage, value in fill_samples.items():
+                    samples[stage].append(value)
+            if not done:
+                return {'error': f'ladder not rebuilt after round {round_index + 1}', 'samples': samples, 'incomplete': incomplete}
+            time.sleep(scenario['pause'])
+    return {'error': None, 'samples': samples, 'incomplete': incomplete}
+
+
+def scenario_key(scenario):
+    return f"runtime={scenario['runtime']} speculative={int(scenario['speculative'])} numOrders={scenario['numOrders']} burst={scenario['burst']} latencyMs={scenario['latencyMs']:g}"
+
+
+def print_results(results):
+    print(f"{'scenario':<68} {'fills':>5}  " + '  '.join(f'{stage + " p50/p99/max ms":>30}' for stage in STAGES))
+    for key, result in results.items():
+        cells = []
+        for stage in STAGES:
+            stats = result['stages'].get(stage)
+            cells.append(f"{stats['p50']:>9.2f}/{stats['p99']:>9.2f}/{stats['max']:>9.2f}" if stats else f"{'-':>29}")
+        note = f"  ({result['error']})" if result['error'] else ''
+        print(f"{key:<68} {result['fills']:>5}  " + '  '.join(f'{cell:>30}' for cell in cells) + note)
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Stages whose p50 or p99 grew by more than tolerance (relative) and min_delta_ms (absolute)."""
+    regressions = []
+    for key, result in results.items():
+        base = baseline['scenarios'].get(key)
+        if base is None:
+            continue
+        for stage in STAGES:
+            current, previous = result['stages'].get(stage), base['stages'].get(stage)
+            if not current or not previous:
+                continue
+            for metric in ['p50', 'p99']:
+                if current[metric] > previous[metric] * (1 + tolerance) and current[metric] - previous[metric] > min_delta_ms:
+                    regressions.append(f'{key} {stage} {metric}: {previous[metric]:.2f}ms -> {current[metric]:.2f}ms')
+    return regressions
+
+
+def parse_list(value, kind=int):
+    return [kind(item) for item in value.split(',') if item.strip()]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Measure grid.py fill-to-replace latency against the local exchange simulator.')
+    parser.add_argument('--num-orders', type=parse_list, default=[1, 5, 10], help='comma-separated numOrders values, default: 1,5,10')
+    parser.add_argument('--burst', type=parse_list, default=[1, 3], help='rungs filled per price move, default: 1,3')
+    parser.add_argument('--latency-ms', type=lambda value: parse_list(value, float), default=[0.0, 5.0], help='exchange response latency, default: 0,5')
+    parser.add_argument('--runtime', type=lambda value: parse_list(value, str), default=['threads'], help='grid.py runtimeMode values: threads,asyncio')
+    parser.add_argument('--speculative', type=parse_list, default=[0, 1], help='grid.py speculativeOrders values, default: 0,1')
+    parser.add_argument('--report-delay-ms', type=float, default=0, help='User Data Stream lag behind the public trade stream, default: 0')
+    parser.add_argument('--fill-batch-ms', type=float, help="override grid.py's fillBatchWindow, e.g. 0 to rebuild on every fill")
+    parser.add_argument('--rounds', type=int, default=20, help='bursts per scenario, default: 20')
+    parser.add_argument('--pause', type=float, default=0.05, help='seconds between bursts, default: 0.05')
+    parser.add_argument('--timeout', type=float, default=15, help='seconds to wait for each rebuild, default: 15')
+    parser.add_argument('--price', default='60500')
+    parser.add_argument('--tick-size', default='0.01')
+    parser.add_argument('--step-size', default='0.00001')
+    parser.add_argument('--min-notional', default='5')
+    parser.add_argument('--quote-balance', default='1000000')
+    parser.add_argument('--base-balance', default='10')
+    parser.add_argument('--save', help='write the results to this JSON baseline file')
+    parser.add_argument('--compare', help='compare against a JSON baseline; exit 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative growth of p50/p99, default: 0.25')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore regressions smaller than this, default: 1.0')
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    scenarios = [
+        {
+            'runtime': runtime, 'speculative': bool(speculative), 'numOrders': num_orders, 'burst': burst,
+            'latencyMs': latency_ms, 'reportDelayMs': args.report_delay_ms, 'fillBatchMs': args.fill_batch_ms,
+            'rounds': args.rounds, 'pause': args.pause, 'timeout': args.timeout, 'price': args.price,
+            'tickSize': args.tick_size, 'stepSize': args.step_size, 'minNotional': args.min_notional,
+            'quoteBalance': args.quote_balance, 'baseBalance': args.base_balance,
+        }
+        for runtime, speculative, num_orders, burst, latency_ms in itertools.product(
+            args.runtime, args.speculative, args.num_orders, args.burst, args.latency_ms,
+        )
+        if burst <= num_orders
+    ]
+
+    results = {}
+    for index, scenario in enumerate(scenarios, 1):
+        key = scenario_key(scenario)
+        print(f'[{index}/{len(scenarios)}] {key}', flush=True)
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+            outcome = executor.submit(run_scenario, scenario).result()
+        results[key] = {
+            'runtime': scenario['runtime'], 'speculative': scenario['speculative'], 'numOrders': scenario['numOrders'], 'burst': scenario['burst'],
+            'latencyMs': scenario['latencyMs'], 'fills': len(outcome['samples']['total']),
+            'incomplete': outcome['incomplete'], 'error': outcome['error'],
+            'stages': {stage: summarize(values) for stage, values in outcome['samples'].items() if values},
+        }
+
+    print()
+    print_results(results)
+    report = {
+        'createdAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'rounds': args.rounds,
+        'reportDelayMs': args.report_delay_ms,
+        'fillBatchMs': args.fill_batch_ms,
+        'scenarios': results,
+    }
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nSaved baseline to {args.save}')
+
+    status = 1 if any(result['error'] for result in results.values()) else 0
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        print(f'\nCompared with {args.compare} (tolerance {args.tolerance:.0%}, min delta {args.min_delta_ms}ms)')
+        for line in regressions:
+            print(f'  REGRESSION {line}')
+        if regressions:
+            status = 1
+        else:
+            print('  no regressions')
+    return status
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""WebSocket message routing throughput benchmark.
+
+Builds a synthetic mix of Binance frames (user data events for subscribed and
+unsubscribed symbols, public trades across many symbols, WebSocket API
+responses) and pushes them through:
+
+    legacy         json.loads every frame, then branch on dict keys (the old
+                   handle_websocket_message / handle_market_message path)
+    router/json    router.Router with the standard library parser
+    router/orjson  router.Router with orjson, when it is installed
+
+Handlers only count calls, so the numbers measure parsing and routing. Results
+are messages per second of CPU time on one core (time.process_time).
+"""
+
+import argparse
+import json
+import random
+import time
+
+import router
+
+
+def compact(message):
+    return json.dumps(message, separators=(',', ':'))
+
+
+def execution_report(symbol, order_id, status, event_time):
+    return compact({'subscriptionId': 0, 'event': {
+        'e': 'executionReport', 'E': event_time, 's': symbol, 'c': f'bngrid-{event_time}-{order_id}', 'S': 'BUY',
+        'o': 'LIMIT', 'f': 'GTC', 'q': '0.00300000', 'p': '59500.00000000', 'P': '0.00000000', 'F': '0.00000000',
+        'g': -1, 'C': '', 'x': 'TRADE' if status != 'NEW' else 'NEW', 'X': status, 'r': 'NONE', 'i': order_id,
+        'l': '0.00100000', 'z': '0.00100000', 'L': '59500.00000000', 'n': '0.00000100', 'N': 'BTC',
+        'T': event_time, 't': order_id * 3, 'v': 0, 'I': order_id * 7, 'w': False, 'm': True, 'M': True,
+        'O': event_time - 5000, 'Z': '59.50000000', 'Y': '59.50000000', 'Q': '0.00000000', 'W': event_time - 5000,
+        'V': 'NONE',
+    }})
+
+
+def account_position(event_time):
+    return compact({'subscriptionId': 0, 'event': {
+        'e': 'outboundAccountPosition', 'E': event_time, 'u': event_time,
+        'B': [{'a': 'BTC', 'f': '1.00000000', 'l': '0.00300000'}, {'a': 'USDT', 'f': '100000.00000000', 'l': '178.50000000'}],
+    }})
+
+
+def trade(symbol, trade_id, price, event_time):
+    stream = f'{symbol.lower()}@trade'
+    return compact({'stream': stream, 'data': {
+        'e': 'trade', 'E': event_time, 's': symbol, 't': trade_id, 'p': f'{price:.2f}', 'q': '0.01200000',
+        'T': event_time, 'm': trade_id % 2 == 0, 'M': True,
+    }})
+
+
+def response(request_id):
+    return compact({'id': f'req-{request_id}', 'status': 200, 'result': {
+        'symbol': 'BTCUSDT', 'orderId': request_id, 'orderListId': -1, 'clientOrderId': f'bngrid-{request_id}',
+        'transactTime': 1700000000000 + request_id,
+    }, 'rateLimits': [{'rateLimitType': 'ORDERS', 'interval': 'SECOND', 'intervalNum': 10, 'limit': 100, 'count': 1}]})
+
+
+def build_frames(args, rng):
+    symbols = ['BTCUSDT'] + [f'SYM{index}USDT' for index in range(1, args.symbols)]
+    subscribed = set(symbols[:args.subscribed])
+    frames = []
+    event_time = 1700000000000
+    for index in range(args.messages):
+        event_time += 1
+        kind = rng.random()
+        if kind < args.trade_share:
+            symbol = rng.choice(symbols)
+            # Most trades land inside the grid's spread; a few cross a rung
+            price = 60000 + rng.uniform(-400, 400) if rng.random() > args.cross_share else 58000.0
+            frames.append(trade(symbol, index, price, event_time))
+        elif kind < args.trade_share + args.report_share:
+            symbol = rng.choice(symbols)
+            frames.append(execution_report(symbol, index, rng.choice(['NEW', 'PARTIALLY_FILLED', 'FILLED']), event_time))
+        elif kind < args.trade_share + args.report_share + 0.05:
+            frames.append(account_position(event_time))
+        else:
+            frames.append(response(index))
+    return frames, subscribed
+
+
+class Counter:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, *_):
+        self.calls += 1
+
+
+def legacy_handler(subscribed, handled):
+    """The pre-router path: full parse, unwrap, then branch on keys."""
+    def handle(message):
+        data = router.unwrap(json.loads(message))
+        if not isinstance(data, dict):
+            return
+        if 'id' in data:
+            handled(data)
+            return
+        event_type = data.get('e')
+        if event_type in ('outboundAccountPosition', 'balanceUpdate'):
+            handled(data)
+        elif event_type == 'executionReport' and data.get('s') in subscribed:
+            handled(data)
+        elif event_type == 'trade' and data.get('s') in subscribed:
+            if float(data['p']) < 59000:
+                handled(data)
+    return handle
+
+
+def routed_handler(subscribed, handled, loads):
+    price_field = router.field_pattern('p')
+
+    def crosses(text):
+        return float(router.string_field(text, price_field)) < 59000
+
+    message_router = router.Router(on_response=handled, loads=loads)
+    for symbol in subscribed:
+        message_router.add('executionReport', handled, symbol)
+        message_router.add('trade', handled, symbol, crosses)
+    message_router.add('outboundAccountPosition', handled)
+    message_router.add('balanceUpdate', handled)
+    return lambda message: message_router.dispatch(None, message)
+
+
+def measure(handle, frames, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.process_time()
+        for frame in frames:
+            handle(frame)
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return len(frames) / best
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Measure WebSocket message routing throughput (messages/s per core).')
+    parser.add_argument('--messages', type=int, default=50000, help='frames in the synthetic mix, default: 50000')
+    parser.add_argument('--symbols', type=int, default=50, help='distinct symbols in the streams, default: 50')
+    parser.add_argument('--subscribed', type=int, default=1, help='symbols the bot trades, default: 1')
+    parser.add_argument('--trade-share', type=float, default=0.8, help='share of public trade frames, default: 0.8')
+    parser.add_argument('--report-share', type=float, default=0.1, help='share of executionReport frames, default: 0.1')
+    parser.add_argument('--cross-share', type=float, default=0.01, help='share of trades that cross a rung, default: 0.01')
+    parser.add_argument('--repeat', type=int, default=5, help='passes per variant; the fastest is reported, default: 5')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    frames, subscribed = build_frames(args, random.Random(args.seed))
+    variants = [('legacy', lambda handled: legacy_handler(subscribed, handled))]
+    variants.append(('router/json', lambda handled: routed_handler(subscribed, handled, json.loads)))
+    if router.orjson:
+        variants.append(('router/orjson', lambda handled: routed_handler(subscribed, handled, router.orjson.loads)))
+    else:
+        print('orjson is not installed; skipping router/orjson')
+
+    print(f'{len(frames)} frames, {args.symbols} symbols, {args.subscribed} subscribed, '
+          f'{args.trade_share:.0%} trades, {args.report_share:.0%} executionReports')
+    baseline = None
+    for name, factory in variants:
+        handled = Counter()
+        rate = measure(factory(handled), frames, args.repeat)
+        baseline = baseline or rate
+        print(f'{name:<14} {rate:>12,.0f} msg/s per core  {rate / baseline:>5.2f}x  handled {handled.calls // args.repeat}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
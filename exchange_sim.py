@@ -0,0 +1,663 @@
+#!/usr/bin/env python3
+"""Local Binance Spot stand-in for end-to-end testing of grid.py.
+
+Serves the REST endpoints the bot uses, the WebSocket API (order entry and the
+User Data Stream) and the public trade stream from one process. Resting orders are
+matched price-time against a synthetic random-walk price feed or a recorded
+kline/trade CSV.
+
+Point the bot at it with:
+
+    BINANCE_REST_URL=http://127.0.0.1:8080 BINANCE_WS_API_URL=ws://127.0.0.1:8765 \
+        BINANCE_STREAM_URL=ws://127.0.0.1:8765 python3 grid.py
+"""
+
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import urllib.parse
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+OPEN_STATUSES = {'NEW', 'PARTIALLY_FILLED'}
+RATE_LIMITS = [
+    {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': 6000},
+    {'rateLimitType': 'ORDERS', 'interval': 'SECOND', 'intervalNum': 10, 'limit': 100},
+    {'rateLimitType': 'ORDERS', 'interval': 'DAY', 'intervalNum': 1, 'limit': 200000},
+]
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def fmt(value):
+    return format(value.normalize(), 'f') if value else '0'
+
+
+class ExchangeError(Exception):
+    def __init__(self, code, msg, status=400, data=None):
+        super().__init__(msg)
+        self.code = code
+        self.msg = msg
+        self.status = status
+        self.data = data
+
+    def body(self):
+        body = {'code': self.code, 'msg': self.msg}
+        if self.data is not None:
+            body['data'] = self.data
+        return body
+
+
+class Exchange:
+    """Single-symbol order book of the bot's own orders, matched against an external price feed.
+
+    Buys rest in a max-heap and sells in a min-heap keyed by (price, sequence), so fills follow
+    price-time priority. Every state change is pushed to the subscribed User Data Streams.
+    """
+
+    def __init__(self, symbol, base_asset, quote_asset, balances, tick_size, step_size, min_notional, fee_rate, rate_limits=RATE_LIMITS):
+        self.symbol = symbol
+        self.base_asset = base_asset
+        self.quote_asset = quote_asset
+        self.tick_size = Decimal(tick_size)
+        self.step_size = Decimal(step_size)
+        self.min_notional = Decimal(min_notional)
+        self.fee_rate = Decimal(fee_rate)
+        self.rate_limits = rate_limits
+        self.balances = {asset: {'free': Decimal(amount), 'locked': Decimal('0')} for asset, amount in balances.items()}
+        for asset in [base_asset, quote_asset]:
+            self.balances.setdefault(asset, {'free': Decimal('0'), 'locked': Decimal('0')})
+        self.orders = {}
+        self.client_orders = {}
+        self.bids = []
+        self.asks = []
+        self.trades = []
+        self.last_price = None
+        self.order_ids = itertools.count(1)
+        self.trade_ids = itertools.count(1)
+        self.sequence = itertools.count()
+        self.lock = threading.RLock()
+        self.listeners = []
+        self.market_listeners = []
+        self.market_trade_ids = itertools.count(1)
+        self.stats = {'placed': 0, 'canceled': 0, 'filled': 0, 'requests': 0}
+
+    # --- events -------------------------------------------------------------------------------
+
+    def emit(self, event):
+        for listener in list(self.listeners):
+            listener(event)
+
+    def emit_order(self, order, execution_type, trade=None):
+        event_time = now_ms()
+        event = {
+            'e': 'executionReport', 'E': event_time, 's': self.symbol,
+            'c': order['clientOrderId'], 'S': order['side'], 'o': 'LIMIT', 'f': 'GTC',
+            'q': fmt(order['origQty']), 'p': fmt(order['price']), 'C': '',
+            'x': execution_type, 'X': order['status'], 'r': 'NONE', 'i': order['orderId'],
+            'l': '0', 'z': fmt(order['executedQty']), 'L': '0', 'n': '0', 'N': None,
+            'T': event_time, 't': -1, 'w': order['status'] in OPEN_STATUSES, 'm': False,
+            'O': order['time'], 'Z': fmt(order['cummulativeQuoteQty']), 'Y': '0', 'Q': '0',
+        }
+        if execution_type == 'CANCELED':
+            event['c'] = f"cancel-{order['orderId']}"
+            event['C'] = order['clientOrderId']
+        if trade:
+            event.update(
+                l=trade['qty'], L=trade['price'], n=trade['commission'], N=trade['commissionAsset'],
+                t=trade['id'], m=trade['isMaker'], Y=trade['quoteQty'], T=trade['time'],
+            )
+        self.emit(event)
+
+    def emit_account(self, assets):
+        self.emit({
+            'e': 'outboundAccountPosition', 'E': now_ms(), 'u': now_ms(),
+            'B': [{'a': asset, 'f': fmt(self.balances[asset]['free']), 'l': fmt(self.balances[asset]['locked'])} for asset in assets],
+        })
+
+    # --- orders -------------------------------------------------------------------------------
+
+    def check_symbol(self, params):
+        if params.get('symbol') != self.symbol:
+            raise ExchangeError(-1121, 'Invalid symbol.')
+
+    def order_view(self, order):
+        return {
+            'symbol': self.symbol, 'orderId': order['orderId'], 'orderListId': -1,
+            'clientOrderId': order['clientOrderId'], 'price': fmt(order['price']),
+            'origQty': fmt(order['origQty']), 'executedQty': fmt(order['executedQty']),
+            'cummulativeQuoteQty': fmt(order['cummulativeQuoteQty']), 'status': order['status'],
+            'timeInForce': 'GTC', 'type': 'LIMIT', 'side': order['side'], 'stopPrice': '0',
+            'time': order['time'], 'updateTime': order['updateTime'], 'isWorking': True,
+            'workingTime': order['time'], 'origQuoteOrderQty': '0', 'selfTradePreventionMode': 'NONE',
+        }
+
+    def new_order(self, params):
+        with self.lock:
+            self.check_symbol(params)
+            if params.get('type', 'LIMIT') != 'LIMIT':
+                raise ExchangeError(-1116, 'Invalid orderType.')
+            side = params['side']
+            price = Decimal(params['price'])
+            qty = Decimal(params['quantity'])
+            if price % self.tick_size or qty % self.step_size or price <= 0 or qty <= 0:
+                raise ExchangeError(-1013, 'Filter failure: PRICE_FILTER / LOT_SIZE')
+            if price * qty < self.min_notional:
+                raise ExchangeError(-1013, 'Filter failure: NOTIONAL')
+            client_order_id = params.get('newClientOrderId') or f'sim-{next(self.sequence)}'
+            if client_order_id in self.client_orders and self.orders[self.client_orders[client_order_id]]['status'] in OPEN_STATUSES:
+                raise ExchangeError(-2010, 'Duplicate order sent.')
+
+            asset, amount = (self.quote_asset, price * qty) if side == 'BUY' else (self.base_asset, qty)
+            if self.balances[asset]['free'] < amount:
+                raise ExchangeError(-2010, 'Account has insufficient balance for requested action.')
+            self.balances[asset]['free'] -= amount
+            self.balances[asset]['locked'] += amount
+
+            timestamp = now_ms()
+            order = {
+                'orderId': next(self.order_ids), 'clientOrderId': client_order_id, 'side': side,
+                'price': price, 'origQty': qty, 'executedQty': Decimal('0'), 'cummulativeQuoteQty': Decimal('0'),
+                'status': 'NEW', 'time': timestamp, 'updateTime': timestamp, 'locked': amount,
+            }
+            self.orders[order['orderId']] = order
+            self.client_orders[client_order_id] = order['orderId']
+            book, key = (self.bids, -price) if side == 'BUY' else (self.asks, price)
+            heapq.heappush(book, (key, next(self.sequence), order['orderId']))
+            self.stats['placed'] += 1
+            self.emit_order(order, 'NEW')
+            self.emit_account([asset])
+
+            # A limit order that crosses the last price is filled immediately as taker
+            if self.last_price is not None and ((side == 'BUY' and price >= self.last_price) or (side == 'SELL' and price <= self.last_price)):
+                self.fill(order, self.last_price, is_maker=False)
+            response = self.order_view(order)
+            response['transactTime'] = timestamp
+            response['fills'] = []
+            return response
+
+    def find_order(self, params):
+        order_id = params.get('orderId')
+        if order_id is not None:
+            order = self.orders.get(int(order_id))
+        else:
+            order = self.orders.get(self.client_orders.get(params.get('origClientOrderId')))
+        if order is None:
+            raise ExchangeError(-2013, 'Order does not exist.')
+        return order
+
+    def get_order(self, params):
+        with self.lock:
+            self.check_symbol(params)
+            return self.order_view(self.find_order(params))
+
+    def cancel_order(self, params):
+        with self.lock:
+            self.check_symbol(params)
+            try:
+                order = self.find_order(params)
+            except ExchangeError:
+                raise ExchangeError(-2011, 'Unknown order sent.')
+            if order['status'] not in OPEN_STATUSES:
+                raise ExchangeError(-2011, 'Unknown order sent.')
+            asset = self.quote_asset if order['side'] == 'BUY' else self.base_asset
+            self.balances[asset]['locked'] -= order['locked']
+            self.balances[asset]['free'] += order['locked']
+            order['locked'] = Decimal('0')
+            order['status'] = 'CANCELED'
+            order['updateTime'] = now_ms()
+            self.stats['canceled'] += 1
+            self.emit_order(order, 'CANCELED')
+            self.emit_account([asset])
+            response = self.order_view(order)
+            response['origClientOrderId'] = order['clientOrderId']
+            response['transactTime'] = order['updateTime']
+            return response
+
+    def cancel_open_orders(self, params):
+        with self.lock:
+            self.check_symbol(params)
+            open_ids = [order_id for order_id, order in self.orders.items() if order['status'] in OPEN_STATUSES]
+            return [self.cancel_order({'symbol': self.symbol, 'orderId': order_id}) for order_id in open_ids]
+
+    def cancel_replace(self, params):
+        """Like Binance: 400 -2022 when nothing was replaced, 409 -2021 when only one leg succeeded, details in error data."""
+        with self.lock:
+            cancel_result = 'SUCCESS'
+            try:
+                cancel_response = self.cancel_order({
+                    'symbol': params.get('symbol'),
+                    'orderId': params.get('cancelOrderId'),
+                    'origClientOrderId': params.get('cancelOrigClientOrderId'),
+                })
+            except ExchangeError as e:
+                cancel_result, cancel_response = 'FAILURE', {'code': e.code, 'msg': e.msg}
+                if params.get('cancelReplaceMode') != 'ALLOW_FAILURE':
+                    raise ExchangeError(-2022, 'Order cancel-replace failed.', data={
+                        'cancelResult': 'FAILURE', 'newOrderResult': 'NOT_ATTEMPTED',
+                        'cancelResponse': cancel_response, 'newOrderResponse': None,
+                    }) from e
+            new_params = {key: value for key, value in params.items() if not key.startswith('cancel')}
+            new_result = 'SUCCESS'
+            try:
+                new_response = self.new_order(new_params)
+            except ExchangeError as e:
+                new_result, new_response = 'FAILURE', {'code': e.code, 'msg': e.msg}
+            result = {'cancelResult': cancel_result, 'newOrderResult': new_result, 'cancelResponse': cancel_response, 'newOrderResponse': new_response}
+            if cancel_result == 'FAILURE' and new_result == 'FAILURE':
+                raise ExchangeError(-2022, 'Order cancel-replace failed.', data=result)
+            if 'FAILURE' in (cancel_result, new_result):
+                raise ExchangeError(-2021, 'Order cancel-replace partially failed.', status=409, data=result)
+            return result
+
+    # --- matching -----------------------------------------------------------------------------
+
+    def fill(self, order, price, is_maker=True):
+        """Fill the remaining quantity of an order at price."""
+        qty = order['origQty'] - order['executedQty']
+        quote_qty = price * qty
+        timestamp = now_ms()
+        if order['side'] == 'BUY':
+            commission, commission_asset = qty * self.fee_rate, self.base_asset
+            self.balances[self.quote_asset]['locked'] -= order['locked']
+            self.balances[self.quote_asset]['free'] += order['locked'] - quote_qty
+            self.balances[self.base_asset]['free'] += qty - commission
+        else:
+            commission, commission_asset = quote_qty * self.fee_rate, self.quote_asset
+            self.balances[self.base_asset]['locked'] -= order['locked']
+            self.balances[self.quote_asset]['free'] += quote_qty - commission
+        order['locked'] = Decimal('0')
+        order['executedQty'] += qty
+        order['cummulativeQuoteQty'] += quote_qty
+        order['status'] = 'FILLED'
+        order['updateTime'] = timestamp
+        trade = {
+            'symbol': self.symbol, 'id': next(self.trade_ids), 'orderId': order['orderId'], 'orderListId': -1,
+            'price': fmt(price), 'qty': fmt(qty), 'quoteQty': fmt(quote_qty),
+            'commission': fmt(commission), 'commissionAsset': commission_asset, 'time': timestamp,
+            'isBuyer': order['side'] == 'BUY', 'isMaker': is_maker, 'isBestMatch': True,
+        }
+        self.trades.append(trade)
+        self.stats['filled'] += 1
+        self.emit_order(order, 'TRADE', trade)
+        self.emit_account([self.base_asset, self.quote_asset])
+
+    def seed_trade(self, side, price, qty):
+        """Record a past fill without touching balances, so the bot has a last trade to anchor its grid on."""
+        with self.lock:
+            timestamp = now_ms()
+            order = {
+                'orderId': next(self.order_ids), 'clientOrderId': f'seed-{next(self.sequence)}', 'side': side,
+                'price': price, 'origQty': qty, 'executedQty': Decimal('0'), 'cummulativeQuoteQty': Decimal('0'),
+                'status': 'NEW', 'time': timestamp, 'updateTime': timestamp, 'locked': Decimal('0'),
+            }
+            self.orders[order['orderId']] = order
+            self.client_orders[order['clientOrderId']] = order['orderId']
+            balances = {asset: dict(b) for asset, b in self.balances.items()}
+            self.fill(order, price)
+            self.balances = balances
+            self.stats['filled'] -= 1
+
+    def on_price(self, price):
+        """Feed tick: fill every resting buy at or above price and every sell at or below it, best price first, then oldest."""
+        with self.lock:
+            self.last_price = price
+            # Public trade first: on the real exchange the trade stream usually beats the user data stream
+            timestamp = now_ms()
+            trade = {
+                'e': 'trade', 'E': timestamp, 's': self.symbol, 't': next(self.market_trade_ids),
+                'p': fmt(price), 'q': fmt(self.step_size), 'T': timestamp, 'm': False, 'M': True,
+            }
+            for listener in list(self.market_listeners):
+                listener(trade)
+            for book, crosses in [(self.bids, lambda key: -key >= price), (self.asks, lambda key: key <= price)]:
+                while book and crosses(book[0][0]):
+                    _, _, order_id = heapq.heappop(book)
+                    order = self.orders[order_id]
+                    if order['status'] in OPEN_STATUSES:
+                        self.fill(order, order['price'])
+                # Cancels only mark the order; drop canceled entries that reached the top of the book
+                while book and self.orders[book[0][2]]['status'] not in OPEN_STATUSES:
+                    heapq.heappop(book)
+
+    # --- queries ------------------------------------------------------------------------------
+
+    def account(self):
+        with self.lock:
+            return {
+                'makerCommission': 10, 'takerCommission': 10, 'canTrade': True, 'updateTime': now_ms(),
+                'accountType': 'SPOT', 'permissions': ['SPOT'],
+                'balances': [{'asset': asset, 'free': fmt(b['free']), 'locked': fmt(b['locked'])} for asset, b in self.balances.items()],
+            }
+
+    def open_orders(self, params):
+        with self.lock:
+            return [self.order_view(order) for order in self.orders.values() if order['status'] in OPEN_STATUSES]
+
+    def all_orders(self, params):
+        """Binance semantics: orderId returns that order and newer ones (oldest first); otherwise
+        startTime/endTime bound the creation time and the most recent `limit` orders are returned."""
+        with self.lock:
+            self.check_symbol(params)
+            limit = min(int(params.get('limit', 500)), 1000)
+            orders = list(self.orders.values())
+            if 'orderId' in params:
+                orders = [order for order in orders if order['orderId'] >= int(params['orderId'])][:limit]
+            else:
+                start_time, end_time = int(params.get('startTime', 0)), int(params.get('endTime', 2 ** 63))
+                orders = [order for order in orders if start_time <= order['time'] <= end_time][-limit:]
+            return [self.order_view(order) for order in orders]
+
+    def my_trades(self, params):
+        with self.lock:
+            self.check_symbol(params)
+            trades = self.trades
+            if 'orderId' in params:
+                trades = [trade for trade in trades if trade['orderId'] == int(params['orderId'])]
+            limit = int(params.get('limit', 500))
+            if 'fromId' in params:
+                return [trade for trade in trades if trade['id'] >= int(params['fromId'])][:limit]
+            return trades[-limit:]
+
+    def exchange_info(self, params):
+        return {
+            'timezone': 'UTC', 'serverTime': now_ms(), 'rateLimits': self.rate_limits,
+            'symbols': [{
+                'symbol': self.symbol, 'status': 'TRADING', 'baseAsset': self.base_asset, 'quoteAsset': self.quote_asset,
+                'filters': [
+                    {'filterType': 'PRICE_FILTER', 'minPrice': fmt(self.tick_size), 'maxPrice': '1000000', 'tickSize': fmt(self.tick_size)},
+                    {'filterType': 'LOT_SIZE', 'minQty': fmt(self.step_size), 'maxQty': '9000', 'stepSize': fmt(self.step_size)},
+                    {'filterType': 'NOTIONAL', 'minNotional': fmt(self.min_notional)},
+                ],
+            }],
+        }
+
+
+# --- REST ---------------------------------------------------------------------------------------
+
+REST_ROUTES = {
+    ('GET', '/api/v3/ping'): lambda exchange, params: {},
+    ('GET', '/api/v3/time'): lambda exchange, params: {'serverTime': now_ms()},
+    ('GET', '/api/v3/exchangeInfo'): lambda exchange, params: exchange.exchange_info(params),
+    ('GET', '/api/v3/account'): lambda exchange, params: exchange.account(),
+    ('GET', '/api/v3/openOrders'): lambda exchange, params: exchange.open_orders(params),
+    ('DELETE', '/api/v3/openOrders'): lambda exchange, params: exchange.cancel_open_orders(params),
+    ('GET', '/api/v3/allOrders'): lambda exchange, params: exchange.all_orders(params),
+    ('GET', '/api/v3/order'): lambda exchange, params: exchange.get_order(params),
+    ('POST', '/api/v3/order'): lambda exchange, params: exchange.new_order(params),
+    ('DELETE', '/api/v3/order'): lambda exchange, params: exchange.cancel_order(params),
+    ('POST', '/api/v3/order/cancelReplace'): lambda exchange, params: exchange.cancel_replace(params),
+    ('GET', '/api/v3/myTrades'): lambda exchange, params: exchange.my_trades(params),
+}
+
+
+def make_rest_handler(exchange, latency):
+    class RestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True  # headers and body go out in separate writes; with Nagle on, the body waits for a delayed ACK
+
+        def handle_request(self, method):
+            url = urllib.parse.urlsplit(self.path)
+            params = dict(urllib.parse.parse_qsl(url.query))
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                params.update(urllib.parse.parse_qsl(self.rfile.read(length).decode('utf-8')))
+            route = REST_ROUTES.get((method, url.path))
+            exchange.stats['requests'] += 1
+            if latency:
+                time.sleep(latency)
+            try:
+                if route is None:
+                    raise ExchangeError(-1000, f'Unsupported endpoint {method} {url.path}', status=404)
+                status, body = 200, route(exchange, params)
+            except ExchangeError as e:
+                status, body = e.status, e.body()
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.send_header('X-MBX-USED-WEIGHT-1M', '1')
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self.handle_request('GET')
+
+        def do_POST(self):
+            self.handle_request('POST')
+
+        def do_DELETE(self):
+            self.handle_request('DELETE')
+
+        def log_message(self, *args):
+            pass
+
+    return RestHandler
+
+
+# --- WebSocket API ------------------------------------------------------------------------------
+
+WS_METHODS = {
+    'order.place': lambda exchange, params: exchange.new_order(params),
+    'order.cancel': lambda exchange, params: exchange.cancel_order(params),
+    'order.cancelReplace': lambda exchange, params: exchange.cancel_replace(params),
+    'order.status': lambda exchange, params: exchange.get_order(params),
+    'openOrders.cancelAll': lambda exchange, params: exchange.cancel_open_orders(params),
+    'openOrders.status': lambda exchange, params: exchange.open_orders(params),
+    'account.status': lambda exchange, params: exchange.account(),
+    'allOrders': lambda exchange, params: exchange.all_orders(params),
+    'myTrades': lambda exchange, params: exchange.my_trades(params),
+    'session.logon': lambda exchange, params: {'apiKey': params.get('apiKey'), 'authorizedSince': now_ms(), 'serverTime': now_ms()},
+    'session.status': lambda exchange, params: {'serverTime': now_ms()},
+    'session.logout': lambda exchange, params: {'serverTime': now_ms()},
+    'ping': lambda exchange, params: {},
+    'time': lambda exchange, params: {'serverTime': now_ms()},
+}
+
+
+async def serve_websocket(exchange, host, port, latency, ready=None, report_delay=0):
+    import websockets
+
+    subscription_ids = itertools.count()
+
+    async def handle_market_stream(connection):
+        """Public trade stream (/ws/<symbol>@trade or /stream?streams=<symbol>@trade), one trade per feed tick."""
+        event_loop = asyncio.get_running_loop()
+        outgoing = asyncio.Queue()
+        stream = f'{exchange.symbol.lower()}@trade'
+        combined = connection.request.path.startswith('/stream')
+
+        def listener(trade):
+            event_loop.call_soon_threadsafe(outgoing.put_nowait, {'stream': stream, 'data': trade} if combined else trade)
+
+        exchange.market_listeners.append(listener)
+        try:
+            while True:
+                await connection.send(json.dumps(await outgoing.get()))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            exchange.market_listeners.remove(listener)
+
+    async def handle(connection):
+        if connection.request.path.startswith(('/ws/', '/stream')):
+            await handle_market_stream(connection)
+            return
+        event_loop = asyncio.get_running_loop()
+        outgoing = asyncio.Queue()
+        subscriptions = []
+
+        def push(message):
+            if report_delay:
+                event_loop.call_later(report_delay, outgoing.put_nowait, message)
+            else:
+                outgoing.put_nowait(message)
+
+        def listener(event):
+            for subscription_id in subscriptions:
+                event_loop.call_soon_threadsafe(push, {'subscriptionId': subscription_id, 'event': event})
+
+        async def sender():
+            while True:
+                message = await outgoing.get()
+                await connection.send(json.dumps(message))
+
+        sender_task = asyncio.create_task(sender())
+        try:
+            async for raw in connection:
+                request = json.loads(raw)
+                request_id, method, params = request.get('id'), request.get('method'), request.get('params', {})
+                exchange.stats['requests'] += 1
+                if latency:
+                    await asyncio.sleep(latency)
+                try:
+                    if method == 'userDataStream.subscribe.signature' or method == 'userDataStream.subscribe':
+                        subscription_id = next(subscription_ids)
+                        if not subscriptions:
+                            exchange.listeners.append(listener)
+                        subscriptions.append(subscription_id)
+                        response = {'id': request_id, 'status': 200, 'result': {'subscriptionId': subscription_id}}
+                    elif method == 'userDataStream.unsubscribe':
+                        subscriptions.clear()
+                        response = {'id': request_id, 'status': 200, 'result': {}}
+                    elif method in WS_METHODS:
+                        result = await asyncio.to_thread(WS_METHODS[method], exchange, params)
+                        response = {'id': request_id, 'status': 200, 'result': result}
+                    else:
+                        raise ExchangeError(-1000, f'Unsupported method {method}')
+                except ExchangeError as e:
+                    response = {'id': request_id, 'status': e.status, 'error': e.body()}
+                outgoing.put_nowait(response)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if listener in exchange.listeners:
+                exchange.listeners.remove(listener)
+            sender_task.cancel()
+
+    async with websockets.serve(handle, host, port):
+        if ready is not None:
+            ready.set()
+        await asyncio.Future()
+
+
+# --- price feeds --------------------------------------------------------------------------------
+
+def synthetic_feed(price, volatility, tick_size):
+    """Geometric random walk, one step per tick."""
+    price = float(price)
+    while True:
+        price *= math.exp(random.gauss(0, volatility))
+        yield (Decimal(repr(price)) // tick_size) * tick_size
+
+
+def recorded_feed(path, data_format, tick_size, loop):
+    import backtest
+
+    path_prices, _ = backtest.load_klines(path) if data_format == 'klines' else backtest.load_trades(path)
+    while True:
+        for price in path_prices.tolist():
+            yield (Decimal(repr(price)) // tick_size) * tick_size
+        if not loop:
+            return
+
+
+def run_feed(exchange, feed, interval):
+    for price in feed:
+        exchange.on_price(price)
+        time.sleep(interval)
+    print('Price feed finished')
+
+
+def report_stats(exchange, every):
+    while True:
+        time.sleep(every)
+        with exchange.lock:
+            open_orders = sum(1 for order in exchange.orders.values() if order['status'] in OPEN_STATUSES)
+            print(f"price={exchange.last_price} open={open_orders} placed={exchange.stats['placed']} "
+                  f"canceled={exchange.stats['canceled']} filled={exchange.stats['filled']} requests={exchange.stats['requests']}")
+
+
+def start_in_background(exchange, host, rest_port, ws_port, latency=0, report_delay=0):
+    """Serve REST and the WebSocket API on daemon threads, for harnesses that drive the exchange in-process."""
+    rest_server = ThreadingHTTPServer((host, rest_port), make_rest_handler(exchange, latency))
+    threading.Thread(target=rest_server.serve_forever, name='rest', daemon=True).start()
+    ready = threading.Event()
+    threading.Thread(
+        target=lambda: asyncio.run(serve_websocket(exchange, host, ws_port, latency, ready, report_delay)), name='ws-api', daemon=True,
+    ).start()
+    if not ready.wait(10):
+        raise RuntimeError('WebSocket API server did not start')
+    return rest_server
+
+
+def parse_balances(value):
+    return dict(item.split('=', 1) for item in value.split(',') if item)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Local Binance Spot simulator (REST + WebSocket API) for grid.py.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--rest-port', type=int, default=8080)
+    parser.add_argument('--ws-port', type=int, default=8765)
+    parser.add_argument('--symbol', default='BTCU')
+    parser.add_argument('--base-asset', default='BTC')
+    parser.add_argument('--quote-asset', default='U')
+    parser.add_argument('--balances', type=parse_balances, default='BTC=1,U=100000', help='starting free balances, default: BTC=1,U=100000')
+    parser.add_argument('--tick-size', default='0.01')
+    parser.add_argument('--step-size', default='0.00001')
+    parser.add_argument('--min-notional', default='5')
+    parser.add_argument('--fee-rate', default='0.001')
+    parser.add_argument('--price', default='60500', help='starting price of the synthetic feed, default: 60500')
+    parser.add_argument('--volatility', type=float, default=0.002, help='per-tick log-return stdev of the synthetic feed')
+    parser.add_argument('--feed', help='replay prices from a kline or trade CSV instead of the synthetic feed')
+    parser.add_argument('--format', choices=['klines', 'trades'], default='klines', help='format of --feed, default: klines')
+    parser.add_argument('--loop', action='store_true', help='restart the recorded feed when it ends')
+    parser.add_argument('--tick-interval', type=float, default=0.1, help='seconds between feed ticks, default: 0.1')
+    parser.add_argument('--seed-side', choices=['BUY', 'SELL', 'NONE'], default='BUY', help='side of the past fill recorded at the starting price, default: BUY')
+    parser.add_argument('--seed-qty', default='0.0001', help='quantity of the seeded fill, default: 0.0001')
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to every REST and WebSocket API response')
+    parser.add_argument('--report-delay', type=float, default=0, help='seconds the User Data Stream lags the public trade stream')
+    parser.add_argument('--stats-interval', type=float, default=10, help='seconds between stats lines, 0 to disable')
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    exchange = Exchange(
+        args.symbol, args.base_asset, args.quote_asset, args.balances,
+        args.tick_size, args.step_size, args.min_notional, args.fee_rate,
+    )
+    if args.feed:
+        feed = recorded_feed(args.feed, args.format, exchange.tick_size, args.loop)
+    else:
+        feed = synthetic_feed(args.price, args.volatility, exchange.tick_size)
+    exchange.on_price(next(feed))
+    if args.seed_side != 'NONE':
+        exchange.seed_trade(args.seed_side, exchange.last_price, Decimal(args.seed_qty))
+
+    rest_server = ThreadingHTTPServer((args.host, args.rest_port), make_rest_handler(exchange, args.latency))
+    threading.Thread(target=rest_server.serve_forever, name='rest', daemon=True).start()
+    threading.Thread(target=run_feed, args=(exchange, feed, args.tick_interval), name='feed', daemon=True).start()
+    if args.stats_interval:
+        threading.Thread(target=report_stats, args=(exchange, args.stats_interval), name='stats', daemon=True).start()
+    print(f'REST http://{args.host}:{args.rest_port}  WebSocket API ws://{args.host}:{args.ws_port}  {args.symbol} @ {exchange.last_price}')
+    try:
+        asyncio.run(serve_websocket(exchange, args.host, args.ws_port, args.latency, report_delay=args.report_delay))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        rest_server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
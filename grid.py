@@ -1,58 +1,391 @@
 import os
 import time
 import hmac
+import base64
 import json
+import heapq
 import hashlib
+import sqlite3
 import asyncio
+import itertools
 from decimal import Decimal
+from collections import OrderedDict
+import queue
 import threading
-import telegram
+import argparse
+import functools
 import traceback
-from dotenv import load_dotenv
-from binance.spot import Spot
-from websocket import WebSocketApp
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 from binance.error import ClientError, ServerError
-import systemd.daemon
+import grid_core
+import ladder as ladder_engine
+import metrics
+import router as message_router
 
 
-# 配置参数
+# 配置参数（单交易对默认值；多个交易对在gridConfigs里逐个配置）
 initialBuyQuantity=0.003
 buyIncrement=0.0003
 sellQuantity=0.003
 priceStep = 1000
 baseAsset = 'BTC'
 quoteAsset = 'U'
-pair = baseAsset + quoteAsset
 numOrders = 1
+gridConfigs = [
+    {
+        'baseAsset': baseAsset,
+        'quoteAsset': quoteAsset,
+        'priceStep': priceStep,
+        'numOrders': numOrders,
+        'initialBuyQuantity': initialBuyQuantity,
+        'buyIncrement': buyIncrement,
+        'sellQuantity': sellQuantity,
+    },
+]
 dryRun = True  # 只读预演：读取账户和成交数据，但不真实下单、不发Telegram
 tradingEnabled = not dryRun
 telegramEnabled = not dryRun
-websocketRestartInterval = 23 * 60 * 60
-restReconcileInterval = 5 * 60
+websocketRestartInterval = 23 * 60 * 60  # 定期轮换时先建新连接并确认订阅，再关闭旧连接，中间没有收不到事件的窗口
+executionReportDedupSize = 4096  # 轮换期间新旧连接会收到同一批事件，按(orderId, tradeId/事件时间, 状态)去重时记住的最近事件数
+restReconcileInterval = 5 * 60  # REST一致性校验周期：所有交易对共用一次账户查询和挂单查询，只有与本地摘要不一致的交易对才增量拉取订单并重建
+reconcileLookback = 60  # 增量拉取变动订单时，在上次校验通过的时间点之前多回看的秒数，覆盖本地与交易所的时钟偏差
 maxEventRetryDelay = 5 * 60
-price_step = Decimal(str(priceStep))
-buy_increment = Decimal(str(buyIncrement))
-initial_buy_quantity = Decimal(str(initialBuyQuantity))
-sell_quantity = Decimal(str(sellQuantity))
+fillBatchWindow = 0.01  # 成交事件微批窗口（秒）：窗口内陆续到达的成交合并为一次网格重建，0表示逐个立即处理
+fillBatchMaxWait = 0.05  # 持续有成交到达时，一批最多等待这么久就开始处理
+runtimeMode = 'threads'  # 'threads'：WebSocket线程+主循环轮询；'asyncio'：单事件循环，成交到达即处理
+restBaseUrl = os.getenv('BINANCE_REST_URL', 'https://api.binance.com')  # 可指向本地模拟交易所（exchange_sim.py）做端到端压测
+marketStreamUrl = os.getenv('BINANCE_STREAM_URL', 'wss://stream.binance.com:9443')
+speculativeOrders = True  # 订阅公开成交流，成交价穿过最近一档挂单时立即挂出预先算好的下一组网格，不等成交回报
+speculativeFeeRate = 0.001  # 预判成交后的余额时按此费率扣除手续费
+presumedFillTimeout = 10  # 预判成交的订单超过该秒数仍未收到终态回报时主动查询订单状态
+websocketApiUrl = os.getenv('BINANCE_WS_API_URL', 'wss://ws-api.binance.com:443/ws-api/v3')
+apiKeyType = 'HMAC'  # 'HMAC'：API_KEY+API_SECRET；'ED25519'：API_KEY+PRIVATE_KEY_PATH，WebSocket API连接先session.logon，之后私有请求不再逐个签名
+websocketSessionQueries = True  # Ed25519会话登录后，账户、挂单、订单和成交查询也走同一条WebSocket连接，不可用时回退REST
+websocketSessionMethods = {  # Spot客户端方法 -> (WebSocket API方法, 位置参数名)
+    'account': ('account.status', []),
+    'get_open_orders': ('openOrders.status', ['symbol']),
+    'get_order': ('order.status', ['symbol']),
+    'get_orders': ('allOrders', ['symbol']),
+    'my_trades': ('myTrades', ['symbol']),
+}
+websocketOrderEntry = True  # 通过WebSocket API流水线下单/撤单，失败时回退REST
+websocketRequestTimeout = 5
+clientOrderPrefix = 'bngrid'
+telegramQueueSize = 100  # 通知队列上限，溢出时丢弃并在下一条消息里汇总丢弃数量
+telegramCoalesceWindow = 1.0  # 合并该窗口内的多条通知为一条消息
+telegramMinInterval = 1.0  # 同一聊天的最小发送间隔
+telegramMaxRetryDelay = 60
+stateJournalPath = 'grid_state_{pair}.journal'  # 每个交易对的网格状态追加日志，重启后重放恢复
+stateSnapshotPath = 'grid_state_{pair}.snapshot.json'
+journalCompactEvery = 200
+tradeStorePath = 'trades.sqlite3'  # 本地成交库，按交易对和fromId增量同步
+tradeSyncLimit = 1000
+symbolFiltersCachePath = 'symbol_filters.json'  # 交易规则磁盘缓存，启动时不必等待exchangeInfo
+symbolFiltersCacheTtl = 86400  # 缓存过期后先用旧值启动，再在后台刷新
+restPoolSize = 8  # REST连接池每个主机保持的keep-alive连接数，需不小于restReadConcurrency
+restReadConcurrency = 4  # 对账时相互独立的REST读请求（挂单、账户、成交、订单查询）并发发出，耗时约为一次往返
+restTimeout = 10
+restPriorities = ['order', 'reconcile', 'balance']  # REST请求优先级：下单撤单 > 对账 > 余额刷新
+restPriorityHeadroom = {'order': 1.0, 'reconcile': 0.8, 'balance': 0.6}  # 各优先级在每个限频窗口内可用的比例，低优先级提前让路
+restRequestCosts = {  # 方法 -> (优先级, 请求权重, 订单计数)
+    'new_order': ('order', 1, 1),
+    'cancel_and_replace': ('order', 1, 1),
+    'cancel_order': ('order', 1, 0),
+    'cancel_open_orders': ('order', 1, 0),
+    'get_order': ('reconcile', 4, 0),
+    'get_open_orders': ('reconcile', 6, 0),
+    'get_orders': ('reconcile', 20, 0),
+    'my_trades': ('reconcile', 20, 0),
+    'account': ('balance', 20, 0),
+    'exchange_info': ('balance', 20, 0),
+}
+restUnscopedWeights = {'get_open_orders': 80}  # 不带symbol调用（覆盖全部交易对）时的请求权重
+websocketRequestCosts = {  # WebSocket API下单方法 -> restRequestCosts中的同类方法，两者共用同一组额度
+    'order.place': 'new_order',
+    'order.cancelReplace': 'cancel_and_replace',
+    'order.cancel': 'cancel_order',
+}
+defaultRateLimits = [  # exchangeInfo未返回rateLimits时使用
+    {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': 6000},
+    {'rateLimitType': 'ORDERS', 'interval': 'SECOND', 'intervalNum': 10, 'limit': 100},
+    {'rateLimitType': 'ORDERS', 'interval': 'DAY', 'intervalNum': 1, 'limit': 200000},
+]
+rateLimitFallbackDelay = {429: 600, 418: 1800}  # 响应缺少Retry-After时的暂停秒数
+rateLimitLoopDelay = 1  # 429/418后主循环只短暂停顿，封禁期间的REST请求在调度器里排队等待并继续喂看门狗
+metricsPort = 0  # Prometheus文本格式指标的HTTP端口（/metrics），0表示关闭
+metricsHost = '127.0.0.1'
+metricsFilePath = None  # 定期写出指标文件，例如node_exporter textfile目录下的bngrid.prom；None表示关闭
+metricsFileInterval = 15
 
 def fmt(value):
     if isinstance(value, Decimal):
         return format(value.normalize(), 'f')
     return str(value)
 
-# 初始化 Binance API 客户端
-load_dotenv()
-api_key = os.getenv('API_KEY')
-api_secret = os.getenv('API_SECRET')
-if not api_key or not api_secret:
-    raise RuntimeError('API_KEY/API_SECRET must be set for grid.py')
-client = Spot(api_key, api_secret)
-
-
-def get_symbol_filters(symbol):
-    """Load Binance symbol filters used for price, quantity and notional checks."""
-    exchange_info = client.exchange_info(symbol=symbol)
-    filters = {item['filterType']: item for item in exchange_info['symbols'][0]['filters']}
+# 凭据、API客户端、Telegram、systemd和WebSocket库都在首次使用时才加载，导入本模块不访问网络
+api_key = None
+api_secret = None
+private_key = None
+private_key_pass = None
+ed25519_signer = None
+bot_token = None
+chat_id = None
+credentials_loaded = False
+startup_phases = []
+
+
+def load_credentials():
+    global api_key, api_secret, private_key, private_key_pass, ed25519_signer, bot_token, chat_id, credentials_loaded
+    if credentials_loaded:
+        return
+    from dotenv import load_dotenv
+    load_dotenv()
+    api_key = os.getenv('API_KEY')
+    if apiKeyType == 'ED25519':
+        from Crypto.PublicKey import ECC
+        from Crypto.Signature import eddsa
+        private_key_path = os.getenv('PRIVATE_KEY_PATH')
+        if not api_key or not private_key_path:
+            raise RuntimeError('API_KEY/PRIVATE_KEY_PATH must be set for Ed25519 keys')
+        with open(private_key_path, encoding='utf-8') as f:
+            private_key = f.read()
+        private_key_pass = os.getenv('PRIVATE_KEY_PASS') or None
+        ed25519_signer = eddsa.new(ECC.import_key(private_key, passphrase=private_key_pass), 'rfc8032')
+    else:
+        api_secret = os.getenv('API_SECRET')
+        if not api_key or not api_secret:
+            raise RuntimeError('API_KEY/API_SECRET must be set for grid.py')
+    bot_token = os.getenv('BOT_TOKEN')
+    chat_id = os.getenv('CHAT_ID')
+    credentials_loaded = True
+
+def create_spot_client():
+    from binance.spot import Spot
+    load_credentials()
+    if apiKeyType == 'ED25519':
+        spot = Spot(api_key, private_key=private_key, private_key_pass=private_key_pass, base_url=restBaseUrl, timeout=restTimeout, show_limit_usage=True)
+    else:
+        spot = Spot(api_key, api_secret, base_url=restBaseUrl, timeout=restTimeout, show_limit_usage=True)
+    mount_rest_pool(spot.session)
+    return spot
+
+def mount_rest_pool(session):
+    """并发读请求各自占用一条keep-alive连接；池子按并发数放大，用尽时排队等待而不是另开用完即弃的连接"""
+    from requests.adapters import HTTPAdapter
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(restPoolSize, restReadConcurrency), max_retries=0, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+def sd_notify(state):
+    import systemd.daemon
+    systemd.daemon.notify(state)
+
+@contextlib.contextmanager
+def startup_phase(name):
+    """记录启动阶段耗时，--profile-startup时输出"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_phases.append((name, time.perf_counter() - started))
+
+def report_startup_profile():
+    total = sum(seconds for _, seconds in startup_phases)
+    print('启动耗时:')
+    for name, seconds in startup_phases:
+        print(f"  {name:<20}{seconds * 1000:>10.1f} ms")
+    print(f"  {'total':<20}{total * 1000:>10.1f} ms")
+
+
+rate_limit_intervals = {'SECOND': 1, 'MINUTE': 60, 'HOUR': 3600, 'DAY': 86400}
+rate_limit_header_units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+rate_limit_kinds = {'REQUEST_WEIGHT': 'weight', 'ORDERS': 'orders'}
+
+# 热路径耗时和计数，见metrics.py；由metricsPort/metricsFilePath导出
+ws_parse_seconds = metrics.histogram('bngrid_ws_parse_seconds', 'WebSocket message parse time', buckets=metrics.FAST_BUCKETS)
+ws_messages_total = metrics.counter('bngrid_ws_messages_total', 'WebSocket messages by type; dropped frames were rejected before parsing', ['type', 'outcome'])
+event_enqueue_seconds = metrics.histogram('bngrid_event_enqueue_seconds', 'Terminal order event enqueue time', buckets=metrics.FAST_BUCKETS)
+update_orders_seconds = metrics.histogram('bngrid_update_orders_seconds', 'update_orders() total time', ['pair'])
+rest_request_seconds = metrics.histogram('bngrid_rest_request_seconds', 'REST call time, excluding rate-limit waits', ['method'])
+ws_request_seconds = metrics.histogram('bngrid_ws_request_seconds', 'WebSocket API request round trip', ['method'])
+ws_requests_total = metrics.counter('bngrid_ws_requests_total', 'WebSocket API requests by method and status', ['method', 'status'])
+rest_wait_seconds = metrics.histogram('bngrid_rest_wait_seconds', 'Time spent waiting for rate-limit budget', ['priority'])
+rest_requests_total = metrics.counter('bngrid_rest_requests_total', 'REST calls by method and outcome', ['method', 'outcome'])
+rate_limit_used = metrics.gauge('bngrid_rate_limit_used', 'Used request weight / order count in the current window', ['kind', 'window'])
+rate_limit_limit = metrics.gauge('bngrid_rate_limit_limit', 'Request weight / order count limit per window', ['kind', 'window'])
+telegram_send_seconds = metrics.histogram('bngrid_telegram_send_seconds', 'Telegram send_message call time')
+telegram_messages_total = metrics.counter('bngrid_telegram_messages_total', 'Telegram notifications by outcome', ['outcome'])
+
+
+class RestRateLimiter:
+    """按Binance限频窗口记账的REST调度器：请求前按优先级预留额度，响应头里的已用量校准本地计数"""
+
+    def __init__(self, rate_limits):
+        self.windows = {}
+        self.condition = threading.Condition()
+        self.waiting = {priority: 0 for priority in restPriorities}
+        self.banned_until = 0
+        self.set_limits(rate_limits)
+
+    def set_limits(self, rate_limits):
+        with self.condition:
+            for item in rate_limits:
+                kind = rate_limit_kinds.get(item['rateLimitType'])
+                if kind is None:
+                    continue
+                seconds = rate_limit_intervals[item['interval']] * item['intervalNum']
+                window = self.windows.setdefault((kind, seconds), {'used': 0, 'start': 0})
+                window['limit'] = item['limit']
+                rate_limit_limit.set(item['limit'], kind, f'{seconds}s')
+
+    def roll(self, key, now):
+        """Binance的限频窗口按整点对齐，跨窗口时清零"""
+        window = self.windows[key]
+        start = now - now % key[1]
+        if window['start'] != start:
+            window['start'] = start
+            window['used'] = 0
+        return window
+
+    def wait_time(self, priority, weight, orders, now):
+        if self.banned_until > now:
+            return self.banned_until - now
+        rank = restPriorities.index(priority)
+        if any(self.waiting[other] for other in restPriorities[:rank]):
+            return 0.05
+        delay = 0
+        for key in self.windows:
+            cost = weight if key[0] == 'weight' else orders
+            if not cost:
+                continue
+            window = self.roll(key, now)
+            if window['used'] + cost > window['limit'] * restPriorityHeadroom[priority]:
+                delay = max(delay, window['start'] + key[1] - now)
+        return delay
+
+    def acquire(self, priority, weight, orders):
+        """预留本次请求的额度；额度不足时等待窗口重置，等待期间更高优先级的请求先行"""
+        with self.condition:
+            self.waiting[priority] += 1
+            try:
+                while True:
+                    now = time.time()
+                    delay = self.wait_time(priority, weight, orders, now)
+                    if delay <= 0:
+                        break
+                    if delay > 1:
+                        print(f"REST限频额度不足，{priority}请求等待{delay:.1f}秒")
+                    self.condition.wait(min(delay, 5))
+                    sd_notify('WATCHDOG=1')
+                for key in self.windows:
+                    window = self.roll(key, now)
+                    window['used'] += weight if key[0] == 'weight' else orders
+                    rate_limit_used.set(window['used'], key[0], f'{key[1]}s')
+            finally:
+                self.waiting[priority] -= 1
+                self.condition.notify_all()
+
+    def record_usage(self, kind, seconds, used):
+        key = (kind, seconds)
+        if key not in self.windows:
+            return
+        window = self.roll(key, time.time())
+        window['used'] = max(window['used'], int(used))
+        rate_limit_used.set(window['used'], kind, f'{seconds}s')
+
+    def record_headers(self, limit_usage):
+        """X-MBX-USED-WEIGHT-1M / X-MBX-ORDER-COUNT-10S等响应头"""
+        with self.condition:
+            for header, used in limit_usage.items():
+                for prefix, kind in [('x-mbx-used-weight-', 'weight'), ('x-mbx-order-count-', 'orders')]:
+                    if header.startswith(prefix):
+                        interval = header[len(prefix):]
+                        self.record_usage(kind, int(interval[:-1]) * rate_limit_header_units[interval[-1]], used)
+
+    def record_websocket_limits(self, rate_limits):
+        """WebSocket API响应里的rateLimits与REST共用同一组额度"""
+        with self.condition:
+            for item in rate_limits:
+                kind = rate_limit_kinds.get(item['rateLimitType'])
+                if kind is not None and 'count' in item:
+                    seconds = rate_limit_intervals[item['interval']] * item['intervalNum']
+                    self.record_usage(kind, seconds, item['count'])
+
+    def ban(self, error):
+        """收到429/418后按Retry-After暂停全部REST请求，返回剩余秒数"""
+        now = time.time()
+        retry_after = (error.header or {}).get('Retry-After')
+        error_data = error.error_data if isinstance(error.error_data, dict) else {}
+        if retry_after:
+            until = now + int(retry_after)
+        elif error_data.get('retryAfter'):
+            until = int(error_data['retryAfter']) / 1000
+        else:
+            until = now + rateLimitFallbackDelay.get(error.status_code, 60)
+        with self.condition:
+            self.banned_until = max(self.banned_until, until)
+            return max(int(self.banned_until - now), 1)
+
+
+class RateLimitedClient:
+    """Spot客户端代理：首次调用时才创建Spot；已知权重的方法先经RestRateLimiter排队，其余属性直接透传"""
+
+    def __init__(self, factory, limiter):
+        self.factory = factory
+        self.limiter = limiter
+        self.spot = None
+        self.spot_lock = threading.Lock()
+
+    def get_spot(self):
+        with self.spot_lock:
+            if self.spot is None:
+                self.spot = self.factory()
+            return self.spot
+
+    def __getattr__(self, name):
+        attr = getattr(self.get_spot(), name)
+        if name not in restRequestCosts:
+            return attr
+
+        priority, weight, orders = restRequestCosts[name]
+        session_method = websocketSessionMethods.get(name) if websocketSessionQueries else None
+
+        def call(*args, **kwargs):
+            unscoped = not args and kwargs.get('symbol') is None and name in restUnscopedWeights
+            with rest_wait_seconds.time(priority):
+                self.limiter.acquire(priority, restUnscopedWeights[name] if unscoped else weight, orders)
+            started = time.perf_counter()
+            try:
+                response = call_websocket_session(*session_method, args, kwargs) if session_method else None
+                if response is None:
+                    response = attr(*args, **kwargs)
+            except ClientError as e:
+                rest_requests_total.inc(name, str(e.status_code))
+                if e.status_code in rateLimitFallbackDelay:
+                    self.limiter.ban(e)
+                raise
+            except Exception:
+                rest_requests_total.inc(name, 'error')
+                raise
+            finally:
+                rest_request_seconds.observe(time.perf_counter() - started, name)
+            rest_requests_total.inc(name, 'ok')
+            if isinstance(response, dict) and 'limit_usage' in response and 'data' in response:
+                self.limiter.record_headers(response['limit_usage'])
+                return response['data']
+            return response
+
+        return call
+
+
+rest_rate_limiter = RestRateLimiter(defaultRateLimits)
+client = RateLimitedClient(create_spot_client, rest_rate_limiter)
+rest_read_executor = ThreadPoolExecutor(max_workers=restReadConcurrency, thread_name_prefix='rest-read')
+
+
+def parse_symbol_filters(symbol_info):
+    filters = {item['filterType']: item for item in symbol_info['filters']}
     min_notional_filter = filters.get('MIN_NOTIONAL') or filters.get('NOTIONAL') or {}
     return {
         'price_quantum': Decimal(filters['PRICE_FILTER']['tickSize']),
@@ -60,29 +393,182 @@ def get_symbol_filters(symbol):
         'min_notional': Decimal(min_notional_filter.get('minNotional', '0')),
     }
 
-symbol_filters = get_symbol_filters(pair)
-price_quantum = symbol_filters['price_quantum']
-quantity_quantum = symbol_filters['quantity_quantum']
-min_notional = symbol_filters['min_notional']
-print(f"Loaded {pair} filters: tickSize={fmt(price_quantum)}, stepSize={fmt(quantity_quantum)}, minNotional={fmt(min_notional)}")
+def fetch_symbol_filters(symbols):
+    """一次exchangeInfo请求拉取全部交易对的规则和限频配置，并写入磁盘缓存"""
+    exchange_info = client.exchange_info(symbols=list(symbols))
+    cache = {
+        'updatedAt': time.time(),
+        'rateLimits': exchange_info.get('rateLimits', []),
+        'symbols': {
+            item['symbol']: {key: fmt(value) for key, value in parse_symbol_filters(item).items()}
+            for item in exchange_info['symbols']
+        },
+    }
+    tmp_path = symbolFiltersCachePath + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, symbolFiltersCachePath)
+    return cache
+
+def load_symbol_filters_cache():
+    try:
+        with open(symbolFiltersCachePath, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def get_symbol_filters(symbols):
+    """Load Binance symbol filters used for price, quantity and notional checks.
+
+    The disk cache is used when it covers every symbol; the second return value tells whether it is past its TTL.
+    """
+    symbols = list(symbols)
+    cache = load_symbol_filters_cache()
+    stale = False
+    if cache is None or any(symbol not in cache['symbols'] for symbol in symbols):
+        cache = fetch_symbol_filters(symbols)
+    else:
+        stale = time.time() - cache['updatedAt'] > symbolFiltersCacheTtl
+    rest_rate_limiter.set_limits(cache['rateLimits'])
+    filters = {
+        symbol: {key: Decimal(value) for key, value in cache['symbols'][symbol].items()}
+        for symbol in symbols
+    }
+    return filters, stale
 
-# 初始化Telegram Bot
-bot_token = os.getenv('BOT_TOKEN')
-chat_id = os.getenv('CHAT_ID')
-bot = telegram.Bot(bot_token) if telegramEnabled and bot_token and chat_id else None
-loop = asyncio.new_event_loop()
-asyncio.set_event_loop(loop)
+def refresh_symbol_filters():
+    """后台刷新过期的交易规则缓存，规则有变化时直接更新对应网格"""
+    try:
+        cache = fetch_symbol_filters(grids_by_symbol)
+    except Exception as e:
+        print(f"后台刷新交易规则失败: {e}")
+        return
+    rest_rate_limiter.set_limits(cache['rateLimits'])
+    for symbol, grid in grids_by_symbol.items():
+        filters = {key: Decimal(value) for key, value in cache['symbols'][symbol].items()}
+        if filters != {'price_quantum': grid.price_quantum, 'quantity_quantum': grid.quantity_quantum, 'min_notional': grid.min_notional}:
+            grid.apply_filters(filters)
+            print(f"{symbol}交易规则已更新: tickSize={fmt(grid.price_quantum)}, stepSize={fmt(grid.quantity_quantum)}, minNotional={fmt(grid.min_notional)}")
+
+
+class Grid:
+    """单个交易对的网格参数、交易规则和运行状态"""
+
+    def __init__(self, config, filters):
+        self.base_asset = config['baseAsset']
+        self.quote_asset = config['quoteAsset']
+        self.pair = self.base_asset + self.quote_asset
+        self.num_orders = config['numOrders']
+        self.price_step = Decimal(str(config['priceStep']))
+        self.buy_increment = Decimal(str(config['buyIncrement']))
+        self.initial_buy_quantity = Decimal(str(config['initialBuyQuantity']))
+        self.sell_quantity = Decimal(str(config['sellQuantity']))
+        self.balance_share = Decimal(str(config.get('balanceShare', 1)))  # 与其他网格共用资产时分得空闲余额的权重
+        self.params = {
+            'priceStep': self.price_step,
+            'numOrders': self.num_orders,
+            'initialBuyQuantity': self.initial_buy_quantity,
+            'buyIncrement': self.buy_increment,
+            'sellQuantity': self.sell_quantity,
+        }
+        self.apply_filters(filters)
+
+        self.buy_orders = set()
+        self.sell_orders = set()
+        self.last_refer_price = Decimal('0')
+        self.last_trade_side = None
+        self.last_trade_qty = Decimal('0')
+        self.order_states_synced = False
+        self.last_verified_at = 0  # 上次确认本地挂单与交易所一致时的毫秒时间戳，增量对账从这里开始拉取变动订单
+        self.update_lock = threading.Lock()
+
+        self.prepared_ladders = {}
+        self.speculative_triggers = (None, None)
+        self.presumed_fills = {}
+        self.needs_resync = False
+
+        self.terminal_events = {}
+        self.terminal_event_heap = []
+        self.fill_batch = []  # 当前微批内的orderId，窗口结束前陆续到达的成交一起推迟到同一时刻处理
+        self.fill_batch_started = 0
+        self.fill_batch_due = 0
+
+        self.journal_path = stateJournalPath.format(pair=self.pair)
+        self.snapshot_path = stateSnapshotPath.format(pair=self.pair)
+        self.journal_buffer = []
+        self.journaled_state = {'buyOrders': set(), 'sellOrders': set(), 'referPrice': None, 'lastTrade': None}
+        self.journal_seq = 0
+        self.journal_records_since_snapshot = 0
+
+    def apply_filters(self, filters):
+        self.filters = filters
+        self.price_quantum = filters['price_quantum']
+        self.quantity_quantum = filters['quantity_quantum']
+        self.min_notional = filters['min_notional']
+
+def build_grids(configs):
+    symbol_filters, stale = get_symbol_filters(config['baseAsset'] + config['quoteAsset'] for config in configs)
+    result = []
+    for config in configs:
+        pair = config['baseAsset'] + config['quoteAsset']
+        grid = Grid(config, symbol_filters[pair])
+        print(f"Loaded {pair} filters: tickSize={fmt(grid.price_quantum)}, stepSize={fmt(grid.quantity_quantum)}, minNotional={fmt(grid.min_notional)}")
+        result.append(grid)
+    return result, stale
+
+def init_grids():
+    """按gridConfigs创建网格；交易规则缓存过期时启动后台刷新"""
+    global grids, grids_by_symbol
+    grids, stale = build_grids(gridConfigs)
+    grids_by_symbol = {grid.pair: grid for grid in grids}
+    register_message_routes()
+    if stale:
+        threading.Thread(target=refresh_symbol_filters, name='symbol-filters-refresh', daemon=True).start()
+
+grids = []
+grids_by_symbol = {}
+
+# Telegram通知队列（Bot在后台线程首次发送时创建）
+notification_queue = queue.Queue(maxsize=telegramQueueSize)
+notification_lock = threading.Lock()
+notification_busy = threading.Event()
+notification_stats = {'dropped': 0}
+notifier_thread = None
 
 # 辅助变量
-buy_orders = []
-sell_orders = []
-last_refer_price = Decimal('0')
-terminal_order_events = []
+trade_store = None
+trade_store_lock = threading.Lock()
+balance_ledger = {}
+balance_ledger_lock = threading.Lock()
+balance_ledger_seeded = False
+order_states = {}
+client_order_index = {}
+order_states_lock = threading.Lock()
+presumed_fills_lock = threading.Lock()  # 预判下单登记与成交回报的归属判断互斥
+open_order_statuses = {'NEW', 'PARTIALLY_FILLED'}
+terminal_order_statuses = {'FILLED', 'CANCELED', 'EXPIRED', 'EXPIRED_IN_MATCH', 'REJECTED'}
+terminal_order_event_seq = itertools.count()
 terminal_order_events_lock = threading.RLock()
 order_update_event = threading.Event()
 ws_restart_event = threading.Event()
 ws_stopping_event = threading.Event()
+session_logged_on_event = threading.Event()
 user_stream_ready_event = threading.Event()
+active_user_ws = None
+standby_user_ws = None  # 轮换中的新连接，确认订阅前不接管请求，只收事件
+standby_ready_event = threading.Event()
+standby_logged_on_event = threading.Event()
+seen_execution_reports = OrderedDict()
+seen_execution_reports_lock = threading.Lock()
+user_stream_router = message_router.Router()  # 路由表在init_grids()之后按交易对注册
+market_stream_router = message_router.Router()
+trade_price_field = message_router.field_pattern('p')
+async_order_update = None
+ws_api_pending = {}
+ws_api_pending_lock = threading.Lock()
+ws_api_request_ids = itertools.count(1)
+client_order_ids = itertools.count(1)
+latency_trace_hook = None  # 延迟基准测试（bench_latency.py）挂入的回调：hook(stage, pair, order_ids, perf_counter)
 
 def to_decimal(value):
     return Decimal(str(value))
@@ -91,252 +577,998 @@ def floor_to_step(value, step):
     value = to_decimal(value)
     return (value // step) * step
 
-def quantize_quantity(quantity):
-    return floor_to_step(quantity, quantity_quantum)
-
-def quantize_price(price):
-    return floor_to_step(price, price_quantum)
+def quantize_quantity(grid, quantity):
+    return floor_to_step(quantity, grid.quantity_quantum)
 
+def quantize_price(grid, price):
+    return floor_to_step(price, grid.price_quantum)
 
-def has_min_notional(price, quantity):
-    return min_notional <= 0 or price * quantity >= min_notional
 
 def send_message(message):
     """
-    发送信息到Telegram
+    发送信息到Telegram：只放入后台队列，不阻塞下单路径
     """
     print(message)  # 输出到日志
-    if telegramEnabled and bot:
+    if telegramEnabled and bot_token and chat_id:
+        start_notifier()
         try:
-            loop.run_until_complete(bot.send_message(chat_id=chat_id, text=message))
+            notification_queue.put_nowait(message)
+        except queue.Full:
+            telegram_messages_total.inc('dropped')
+            with notification_lock:
+                notification_stats['dropped'] += 1
+
+def start_notifier():
+    global notifier_thread
+    with notification_lock:
+        if notifier_thread is None:
+            notifier_thread = threading.Thread(target=run_notifier, name='telegram-notifier', daemon=True)
+            notifier_thread.start()
+
+def collect_notifications():
+    """阻塞等待第一条通知，再收集合并窗口内陆续到达的通知"""
+    messages = [notification_queue.get()]
+    notification_busy.set()
+    deadline = time.time() + telegramCoalesceWindow
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        try:
+            messages.append(notification_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    with notification_lock:
+        dropped = notification_stats['dropped']
+        notification_stats['dropped'] = 0
+    return messages, dropped
+
+def merge_notifications(messages, dropped, limit=4096):
+    """合并为一条消息；超出Telegram长度上限时截断并注明省略条数"""
+    if dropped:
+        messages = messages + [f"通知过多，已丢弃{dropped}条"]
+    text = ''
+    for index, message in enumerate(messages):
+        part = message if not text else '\n\n' + message
+        if len(text) + len(part) > limit - 20:
+            return text + f"\n\n...省略{len(messages) - index}条"
+        text += part
+    return text
+
+def deliver_notification(event_loop, bot, text):
+    """发送一条消息，遵守Telegram的RetryAfter，其余错误指数退避重试"""
+    import telegram
+    delay = 1
+    while True:
+        try:
+            with telegram_send_seconds.time():
+                event_loop.run_until_complete(bot.send_message(chat_id=chat_id, text=text))
+            telegram_messages_total.inc('sent')
+            return
+        except telegram.error.RetryAfter as e:
+            telegram_messages_total.inc('retry_after')
+            retry_after = e.retry_after
+            retry_after = retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else retry_after
+            print(f"Telegram限流，{retry_after}秒后重试")
+            time.sleep(retry_after)
         except Exception as e:
-            print(f"发送消息时发生错误: {e}")
-
-def format_price(price):
+            if delay > telegramMaxRetryDelay:
+                print(f"发送消息时发生错误，放弃发送: {e}")
+                telegram_messages_total.inc('failed')
+                return
+            print(f"发送消息时发生错误，{delay}秒后重试: {e}")
+            time.sleep(delay)
+            delay *= 2
+
+def run_notifier():
+    import telegram
+    event_loop = asyncio.new_event_loop()
+    bot = telegram.Bot(bot_token)
+    while True:
+        messages, dropped = collect_notifications()
+        try:
+            deliver_notification(event_loop, bot, merge_notifications(messages, dropped))
+        finally:
+            notification_busy.clear()
+        time.sleep(telegramMinInterval)
+
+def flush_notifications(timeout=5):
+    """退出前尽量把队列中的通知发完"""
+    deadline = time.time() + timeout
+    while (not notification_queue.empty() or notification_busy.is_set()) and time.time() < deadline:
+        time.sleep(0.1)
+
+def format_price(grid, price):
     """价格抹零，格式化为priceStep的整数倍加priceStep/2"""
-    return quantize_price((to_decimal(price) // price_step * price_step) + (price_step / 2))
+    return grid_core.initial_refer_price(to_decimal(price), grid.price_step, grid.price_quantum)
 
-def get_balance():
-    """获取资产余额"""
-    balance = {
-        baseAsset: {'free': Decimal('0'), 'locked': Decimal('0')},
-        quoteAsset: {'free': Decimal('0'), 'locked': Decimal('0')},
-    }
+def seed_balance_ledger():
+    """用一次REST账户查询初始化本地余额账本，之后由User Data Stream事件增量维护"""
     try:
         account_info = client.account()
-        for each in account_info['balances']:
-            if each['asset'] in [baseAsset, quoteAsset]:
-                balance[each['asset']] = {'free': to_decimal(each['free']), 'locked': to_decimal(each['locked'])}
-        return balance
     except Exception as e:
         print(f"获取余额失败: {e}")
         raise
+    apply_account_snapshot(account_info)
+
+def apply_account_snapshot(account_info):
+    global balance_ledger_seeded
+    update_time = int(account_info.get('updateTime') or 0)
+    ledger = {
+        asset: {'free': Decimal('0'), 'locked': Decimal('0'), 'updateTime': update_time, 'snapshotTime': update_time}
+        for grid in grids
+        for asset in [grid.base_asset, grid.quote_asset]
+    }
+    for each in account_info['balances']:
+        if each['asset'] in ledger:
+            ledger[each['asset']].update(free=to_decimal(each['free']), locked=to_decimal(each['locked']))
+    with balance_ledger_lock:
+        balance_ledger.clear()
+        balance_ledger.update(ledger)
+        balance_ledger_seeded = True
+
+def balance_ledger_mismatches(account_info):
+    """账户快照与本地账本的总额（free+locked）不一致的资产；账本条目比快照新（快照之后又收到事件）的不比较"""
+    update_time = int(account_info.get('updateTime') or 0)
+    balances = {each['asset']: to_decimal(each['free']) + to_decimal(each['locked']) for each in account_info['balances']}
+    with balance_ledger_lock:
+        return [
+            asset for asset, entry in balance_ledger.items()
+            if entry['updateTime'] <= update_time and entry['free'] + entry['locked'] != balances.get(asset, Decimal('0'))
+        ]
+
+def invalidate_balance_ledger():
+    """事件可能丢失（重连、兜底对账）时标记账本失效，下次读取重新走REST"""
+    global balance_ledger_seeded
+    with balance_ledger_lock:
+        balance_ledger_seeded = False
+
+def apply_balance_delta(asset, delta, event_time):
+    """应用余额增量；只有已被账户快照覆盖的事件才忽略。同一毫秒可以有多笔增量（一笔吃单成交多档），
+    不能按上一笔增量的时间去重，重复推送的成交回报由is_duplicate_execution_report过滤"""
+    entry = balance_ledger.get(asset)
+    if entry is None or event_time <= entry['snapshotTime']:
+        return
+    entry['free'] += delta
+    entry['updateTime'] = max(entry['updateTime'], event_time)
+
+def apply_account_position(data):
+    """outboundAccountPosition：变动资产的最新余额快照"""
+    update_time = int(data.get('u') or data.get('E') or 0)
+    with balance_ledger_lock:
+        for each in data.get('B', []):
+            entry = balance_ledger.get(each['a'])
+            if entry is None or update_time < entry['updateTime']:
+                continue
+            entry.update(free=to_decimal(each['f']), locked=to_decimal(each['l']), updateTime=update_time, snapshotTime=update_time)
+
+def apply_balance_update(data):
+    """balanceUpdate：充值、提现、划转带来的余额增量"""
+    with balance_ledger_lock:
+        apply_balance_delta(data['a'], to_decimal(data['d']), int(data.get('T') or data.get('E') or 0))
+
+def apply_execution_report(grid, data):
+    """成交回报先行更新账本总额，随后的outboundAccountPosition再覆盖为交易所的精确值"""
+    if data.get('x') != 'TRADE':
+        return
+    last_qty = to_decimal(data['l'])
+    last_quote = to_decimal(data['Y']) if data.get('Y') is not None else last_qty * to_decimal(data['L'])
+    event_time = int(data.get('T') or data.get('E') or 0)
+    sign = 1 if data['S'] == 'BUY' else -1
+    deltas = {grid.base_asset: sign * last_qty, grid.quote_asset: -sign * last_quote}
+    if data.get('N'):
+        deltas[data['N']] = deltas.get(data['N'], Decimal('0')) - to_decimal(data.get('n') or 0)
+    with balance_ledger_lock:
+        for asset, delta in deltas.items():
+            apply_balance_delta(asset, delta, event_time)
+
+def get_balance(grid):
+    """获取网格两种资产的余额（本地账本，未初始化时走一次REST）"""
+    if not balance_ledger_seeded:
+        seed_balance_ledger()
+    with balance_ledger_lock:
+        return {
+            asset: {'free': balance_ledger[asset]['free'], 'locked': balance_ledger[asset]['locked']}
+            for asset in [grid.base_asset, grid.quote_asset]
+        }
+
+def grid_balances(grid):
+    """网格规划梯子用的(基础资产, 计价资产)总额。资产只被这个网格使用时就是账户的free+locked；
+    多个网格共用一种资产时只算本交易对挂单锁定的部分，空闲余额按balanceShare分配，不会把其他网格的挂单当作自己的预算"""
+    balance = get_balance(grid)
+    locked = {grid.base_asset: Decimal('0'), grid.quote_asset: Decimal('0')}
+    for order in live_order_states(grid):
+        remaining = order['origQty'] - order['executedQty']
+        if order['side'] == 'BUY':
+            locked[grid.quote_asset] += order['price'] * remaining
+        else:
+            locked[grid.base_asset] += remaining
+    totals = {}
+    for asset in [grid.base_asset, grid.quote_asset]:
+        sharing = [other for other in grids if asset in (other.base_asset, other.quote_asset)]
+        if len(sharing) <= 1:
+            totals[asset] = balance[asset]['free'] + balance[asset]['locked']
+        else:
+            share = grid.balance_share / sum(other.balance_share for other in sharing)
+            totals[asset] = balance[asset]['free'] * share + locked[asset]
+    return totals[grid.base_asset], totals[grid.quote_asset]
+
+def open_trade_store():
+    global trade_store
+    if trade_store is None:
+        trade_store = sqlite3.connect(tradeStorePath, check_same_thread=False)
+        trade_store.executescript("""
+            CREATE TABLE IF NOT EXISTS trades (
+                id INTEGER NOT NULL, symbol TEXT NOT NULL, orderId INTEGER NOT NULL,
+                price TEXT NOT NULL, qty TEXT NOT NULL, isBuyer INTEGER NOT NULL, time INTEGER NOT NULL,
+                PRIMARY KEY (symbol, id)
+            );
+            CREATE INDEX IF NOT EXISTS trades_by_order ON trades (symbol, orderId);
+            CREATE TABLE IF NOT EXISTS trade_cursors (
+                symbol TEXT PRIMARY KEY, lastId INTEGER NOT NULL, seededFromId INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS backfilled_orders (
+                symbol TEXT NOT NULL, orderId INTEGER NOT NULL, PRIMARY KEY (symbol, orderId)
+            );
+        """)
+    return trade_store
+
+def store_trades(db, symbol, trades):
+    db.executemany(
+        'INSERT OR IGNORE INTO trades (id, symbol, orderId, price, qty, isBuyer, time) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [
+            (int(trade['id']), symbol, int(trade['orderId']), trade['price'], trade['qty'], int(bool(trade['isBuyer'])), int(trade['time']))
+            for trade in trades
+        ],
+    )
+
+def sync_trades(symbol):
+    """从fromId游标开始只拉取新成交；首次同步只取最近一页作为起点"""
+    with trade_store_lock:
+        db = open_trade_store()
+        cursor = db.execute('SELECT lastId, seededFromId FROM trade_cursors WHERE symbol = ?', (symbol,)).fetchone()
+        if cursor is None:
+            trades = client.my_trades(symbol, limit=tradeSyncLimit)
+            if not trades:
+                return
+            with db:
+                store_trades(db, symbol, trades)
+                db.execute(
+                    'INSERT INTO trade_cursors (symbol, lastId, seededFromId) VALUES (?, ?, ?)',
+                    (
+                        symbol,
+                        max(int(trade['id']) for trade in trades),
+                        min(int(trade['id']) for trade in trades) if len(trades) >= tradeSyncLimit else 0,
+                    ),
+                )
+            return
+
+        last_id = cursor[0]
+        while True:
+            trades = client.my_trades(symbol, fromId=last_id + 1, limit=tradeSyncLimit)
+            if not trades:
+                return
+            last_id = max(int(trade['id']) for trade in trades)
+            with db:
+                store_trades(db, symbol, trades)
+                db.execute('UPDATE trade_cursors SET lastId = ? WHERE symbol = ?', (last_id, symbol))
+            if len(trades) < tradeSyncLimit:
+                return
+
+def order_executed_qty(symbol, order_id):
+    """按本地成交索引汇总订单累计成交量；订单可能早于首次同步起点时补拉该订单的成交，每个订单只补拉一次"""
+    with trade_store_lock:
+        db = open_trade_store()
+        seeded_from_id = db.execute('SELECT seededFromId FROM trade_cursors WHERE symbol = ?', (symbol,)).fetchone()[0]
+        rows = db.execute('SELECT id, qty FROM trades WHERE symbol = ? AND orderId = ?', (symbol, order_id)).fetchall()
+        backfilled = db.execute('SELECT 1 FROM backfilled_orders WHERE symbol = ? AND orderId = ?', (symbol, order_id)).fetchone()
+        if not backfilled and min(row[0] for row in rows) <= seeded_from_id:
+            trades = client.my_trades(symbol, orderId=order_id)
+            with db:
+                store_trades(db, symbol, trades)
+                db.execute('INSERT OR IGNORE INTO backfilled_orders (symbol, orderId) VALUES (?, ?)', (symbol, order_id))
+            rows = db.execute('SELECT id, qty FROM trades WHERE symbol = ? AND orderId = ?', (symbol, order_id)).fetchall()
+    return sum((to_decimal(row[1]) for row in rows), Decimal('0'))
 
 def get_last_trade_summary(symbol):
     """获取最近成交所属订单的累计成交数量"""
     try:
-        my_trades = client.my_trades(symbol)
-        if not my_trades:
+        sync_trades(symbol)
+        with trade_store_lock:
+            last_trade = open_trade_store().execute(
+                'SELECT orderId, price, isBuyer FROM trades WHERE symbol = ? ORDER BY id DESC LIMIT 1', (symbol,)
+            ).fetchone()
+        if not last_trade:
             print("无法获取历史交易数据，跳过本次更新")
             return None
-        last_trade = my_trades[-1]
+        order_id, price, is_buyer = last_trade
+        qty = order_executed_qty(symbol, order_id)
     except Exception as e:
         print(f"获取最新交易失败: {e}")
         raise
 
-    try:
-        order_info = client.get_order(symbol=symbol, orderId=int(last_trade['orderId']))
-        qty = to_decimal(order_info['executedQty'])
-    except Exception as e:
-        print(f"获取订单累计成交数量失败，回退到单笔成交数量: {e}")
-        qty = to_decimal(last_trade['qty'])
-
     return {
-        'side': 'BUY' if last_trade['isBuyer'] else 'SELL',
+        'side': 'BUY' if is_buyer else 'SELL',
         'qty': qty,
-        'price': to_decimal(last_trade['price']),
+        'price': to_decimal(price),
     }
 
-def refresh_balance_if_needed(asset, current_balance, required_balance, attempts=3, wait_time=1):
-    """余额不足时短暂刷新，避免取消挂单后的余额延迟造成误判"""
-    if current_balance >= required_balance:
-        return current_balance
-
-    for attempt in range(attempts):
-        try:
-            print(f"{asset}余额暂不足，等待{wait_time}秒后刷新... (尝试 {attempt + 1}/{attempts})")
-            time.sleep(wait_time)
-            balance = get_balance()
-            latest_balance = balance[asset]['free'] + balance[asset]['locked']
-            if latest_balance >= required_balance:
-                return latest_balance
-            current_balance = latest_balance
-        except Exception as e:
-            print(f"刷新{asset}余额时发生错误: {e}")
-
-    return current_balance
-
-def push_terminal_order_event(data):
-    event = {
+def is_tracked_order(grid, order_id):
+    return order_id in grid.buy_orders or order_id in grid.sell_orders
+
+def update_order_state(state):
+    """写入订单状态；忽略更旧的事件，终态不会被非终态覆盖"""
+    with order_states_lock:
+        current = order_states.get(state['orderId'])
+        if current and (
+            state['updateTime'] < current['updateTime']
+            or (current['status'] in terminal_order_statuses and state['status'] not in terminal_order_statuses)
+        ):
+            return
+        order_states[state['orderId']] = state
+        if state['clientOrderId']:
+            client_order_index[state['clientOrderId']] = state['orderId']
+
+def record_order_state(order):
+    """记录REST/WebSocket API返回的订单"""
+    update_order_state({
+        'orderId': int(order['orderId']),
+        'clientOrderId': order.get('clientOrderId'),
+        'symbol': order['symbol'],
+        'side': order['side'],
+        'status': order['status'],
+        'price': to_decimal(order['price']),
+        'origQty': to_decimal(order['origQty']),
+        'executedQty': to_decimal(order.get('executedQty', '0')),
+        'updateTime': int(order.get('updateTime') or order.get('transactTime') or 0),
+    })
+
+def apply_order_update(data):
+    """executionReport：撤单事件的原始clientOrderId在C字段"""
+    client_order_id = data.get('C') if data.get('X') == 'CANCELED' and data.get('C') else data.get('c')
+    update_order_state({
         'orderId': int(data['i']),
+        'clientOrderId': client_order_id,
+        'symbol': data['s'],
         'side': data['S'],
         'status': data['X'],
-        'qty': to_decimal(data['z']),
         'price': to_decimal(data['p']),
-        'time': int(data.get('T') or data.get('E') or 0),
-        'attempts': 0,
-        'nextRetryAt': 0,
-    }
-    with terminal_order_events_lock:
-        terminal_order_events.append(event)
-
+        'origQty': to_decimal(data['q']),
+        'executedQty': to_decimal(data['z']),
+        'updateTime': int(data.get('T') or data.get('E') or 0),
+    })
+
+def get_order_state(order_id=None, client_order_id=None):
+    with order_states_lock:
+        if order_id is None:
+            order_id = client_order_index.get(client_order_id)
+        state = order_states.get(order_id)
+        return dict(state) if state else None
+
+def live_order_states(grid):
+    with order_states_lock:
+        return [
+            dict(state) for state in order_states.values()
+            if state['symbol'] == grid.pair and state['status'] in open_order_statuses
+        ]
 
-def snapshot_terminal_order_events(now=None):
+def sync_open_order_states(grid, open_orders, snapshot_started_at=None):
+    """用REST挂单快照校准本地订单状态；本地认为仍在挂但快照里没有的订单移除，之后按需REST查询。
+    给出snapshot_started_at时，快照发出之后才有变动的本地订单保留"""
+    open_order_ids = set()
+    for order in open_orders:
+        record_order_state(order)
+        open_order_ids.add(int(order['orderId']))
+    with order_states_lock:
+        for order_id, state in list(order_states.items()):
+            if state['symbol'] == grid.pair and state['status'] in open_order_statuses and order_id not in open_order_ids:
+                if snapshot_started_at is not None and state['updateTime'] >= snapshot_started_at:
+                    continue
+                del order_states[order_id]
+        grid.order_states_synced = True
+
+def invalidate_order_states():
+    with order_states_lock:
+        for grid in grids:
+            grid.order_states_synced = False
+
+def prune_order_states(grid):
+    """清理该交易对已结束且不再跟踪的订单；等待确认的预判成交保留，供resolve_presumed_fills读取终态"""
+    with order_states_lock:
+        for order_id, state in list(order_states.items()):
+            if (
+                state['symbol'] == grid.pair and state['status'] in terminal_order_statuses
+                and not is_tracked_order(grid, order_id) and order_id not in grid.presumed_fills
+            ):
+                del order_states[order_id]
+                client_order_index.pop(state['clientOrderId'], None)
+
+def lookup_order(grid, order_id):
+    """优先读本地终态记录，本地没有时才REST查询"""
+    state = get_order_state(order_id)
+    if state and state['status'] in terminal_order_statuses:
+        return state
+    order_info = client.get_order(symbol=grid.pair, orderId=int(order_id))
+    record_order_state(order_info)
+    return order_info
+
+def lookup_orders(grid, order_ids):
+    """并发查询多笔已结束订单，返回orderId -> 订单信息"""
+    order_ids = list(order_ids)
+    if len(order_ids) <= 1:
+        return {order_id: lookup_order(grid, order_id) for order_id in order_ids}
+    return dict(zip(order_ids, rest_read_executor.map(functools.partial(lookup_order, grid), order_ids)))
+
+class TerminalOrderEvent:
+    """已结束订单的待处理事件；version用于识别堆里被替换或重新排期的旧条目"""
+    __slots__ = ('orderId', 'side', 'status', 'qty', 'price', 'time', 'attempts', 'nextRetryAt', 'version')
+
+    def __init__(self, order_id, side, status, qty, price, event_time):
+        self.orderId = order_id
+        self.side = side
+        self.status = status
+        self.qty = qty
+        self.price = price
+        self.time = event_time
+        self.attempts = 0
+        self.nextRetryAt = 0
+        self.version = 0
+
+def schedule_terminal_order_event(grid, event):
+    event.version += 1
+    heapq.heappush(grid.terminal_event_heap, (event.nextRetryAt, next(terminal_order_event_seq), event.orderId, event.version))
+
+def is_current_heap_entry(grid, entry):
+    event = grid.terminal_events.get(entry[2])
+    return event is not None and event.version == entry[3]
+
+def compact_terminal_order_event_heap(grid):
+    """丢弃/替换留下的失效条目过多时重建堆"""
+    if len(grid.terminal_event_heap) > 2 * len(grid.terminal_events) + 16:
+        grid.terminal_event_heap[:] = [entry for entry in grid.terminal_event_heap if is_current_heap_entry(grid, entry)]
+        heapq.heapify(grid.terminal_event_heap)
+
+def push_terminal_order_event(grid, data):
+    event = TerminalOrderEvent(
+        int(data['i']),
+        data['S'],
+        data['X'],
+        to_decimal(data['z']),
+        to_decimal(data['p']),
+        int(data.get('T') or data.get('E') or 0),
+    )
+    with terminal_order_events_lock:
+        previous = grid.terminal_events.get(event.orderId)
+        if previous:
+            event.version = previous.version
+        grid.terminal_events[event.orderId] = event
+        add_to_fill_batch(grid, event.orderId, time.time())
+        compact_terminal_order_event_heap(grid)
+
+def add_to_fill_batch(grid, order_id, now):
+    """新成交把整批的到期时间推后到now+fillBatchWindow，但不超过批次开始后fillBatchMaxWait；
+    整批同时到期，一次update_orders()按净移动的参考价重建，中途不会先挂出马上又要撤掉的单"""
+    if now >= grid.fill_batch_due:
+        grid.fill_batch = []
+        grid.fill_batch_started = now
+    grid.fill_batch_due = min(now + fillBatchWindow, grid.fill_batch_started + fillBatchMaxWait)
+    grid.fill_batch.append(order_id)
+    for batched_order_id in grid.fill_batch:
+        event = grid.terminal_events.get(batched_order_id)
+        if event is not None and event.attempts == 0:
+            event.nextRetryAt = grid.fill_batch_due
+            schedule_terminal_order_event(grid, event)
+
+
+def snapshot_terminal_order_events(grid, now=None):
+    """按堆结构只遍历到期的分支，复杂度与到期事件数成正比"""
     if now is None:
         now = time.time()
+    events = []
     with terminal_order_events_lock:
-        return [
-            event for event in terminal_order_events
-            if event.get('nextRetryAt', 0) <= now
-        ]
+        heap = grid.terminal_event_heap
+        stack = [0]
+        while stack:
+            index = stack.pop()
+            if index >= len(heap) or heap[index][0] > now:
+                continue
+            if is_current_heap_entry(grid, heap[index]):
+                events.append(grid.terminal_events[heap[index][2]])
+            stack.extend((2 * index + 1, 2 * index + 2))
+    return events
 
 
-def discard_terminal_order_events(order_ids):
-    order_ids = set(order_ids)
-    if not order_ids:
-        return
+def discard_terminal_order_events(grid, order_ids):
     with terminal_order_events_lock:
-        terminal_order_events[:] = [
-            event for event in terminal_order_events
-            if event['orderId'] not in order_ids
-        ]
+        for order_id in order_ids:
+            grid.terminal_events.pop(order_id, None)
+        compact_terminal_order_event_heap(grid)
 
 
-def defer_terminal_order_events(order_ids):
-    order_ids = set(order_ids)
-    if not order_ids:
-        return
+def defer_terminal_order_events(grid, order_ids):
     now = time.time()
     with terminal_order_events_lock:
-        for event in terminal_order_events:
-            if event['orderId'] not in order_ids:
+        for order_id in order_ids:
+            event = grid.terminal_events.get(order_id)
+            if event is None:
                 continue
-            event['attempts'] = event.get('attempts', 0) + 1
-            delay = min(2 ** (event['attempts'] - 1), maxEventRetryDelay)
-            event['nextRetryAt'] = now + delay
-            print(f"订单事件处理失败，{delay}秒后重试: orderId={event['orderId']} attempts={event['attempts']}")
+            event.attempts += 1
+            delay = min(2 ** (event.attempts - 1), maxEventRetryDelay)
+            event.nextRetryAt = now + delay
+            schedule_terminal_order_event(grid, event)
+            print(f"{grid.pair}订单事件处理失败，{delay}秒后重试: orderId={event.orderId} attempts={event.attempts}")
+        compact_terminal_order_event_heap(grid)
 
 
-def prune_stale_terminal_order_events():
-    tracked_order_ids = set(buy_orders + sell_orders)
+def prune_stale_terminal_order_events(grid):
     with terminal_order_events_lock:
-        terminal_order_events[:] = [
-            event for event in terminal_order_events
-            if event['orderId'] in tracked_order_ids
-        ]
+        for order_id in list(grid.terminal_events):
+            if not is_tracked_order(grid, order_id):
+                del grid.terminal_events[order_id]
+        compact_terminal_order_event_heap(grid)
 
 
-def has_due_terminal_order_events(now=None):
+def has_due_terminal_order_events(grid, now=None):
+    """查看堆顶即可判断；顺带弹出失效条目和已不再跟踪的订单事件"""
     if now is None:
         now = time.time()
-    tracked_order_ids = set(buy_orders + sell_orders)
-    if not tracked_order_ids:
+    with terminal_order_events_lock:
+        heap = grid.terminal_event_heap
+        while heap:
+            entry = heap[0]
+            if not is_current_heap_entry(grid, entry):
+                heapq.heappop(heap)
+            elif not is_tracked_order(grid, entry[2]):
+                heapq.heappop(heap)
+                del grid.terminal_events[entry[2]]
+            else:
+                return entry[0] <= now
         return False
+
+def next_terminal_event_delay(now=None):
+    """距离最早一个待处理事件到期（微批窗口结束或重试退避结束）的秒数；没有待处理事件时返回None"""
+    if now is None:
+        now = time.time()
     with terminal_order_events_lock:
-        return any(
-            event['orderId'] in tracked_order_ids and event.get('nextRetryAt', 0) <= now
-            for event in terminal_order_events
-        )
+        due_times = [grid.terminal_event_heap[0][0] for grid in grids if grid.terminal_event_heap]
+    return max(min(due_times) - now, 0) if due_times else None
+
+def journal_append(grid, record):
+    grid.journal_seq += 1
+    grid.journal_records_since_snapshot += 1
+    grid.journal_buffer.append(json.dumps(dict(record, seq=grid.journal_seq), separators=(',', ':')))
+
+def journal_grid_state(grid):
+    """把本次更新后网格状态的变化追加到日志缓冲"""
+    journaled_state = grid.journaled_state
+    for side, orders in [('BUY', grid.buy_orders), ('SELL', grid.sell_orders)]:
+        key = 'buyOrders' if side == 'BUY' else 'sellOrders'
+        for order_id in orders - journaled_state[key]:
+            journal_append(grid, {'op': 'add', 'side': side, 'orderId': order_id})
+        for order_id in journaled_state[key] - orders:
+            journal_append(grid, {'op': 'remove', 'side': side, 'orderId': order_id})
+        journaled_state[key] = set(orders)
+
+    refer_price = fmt(grid.last_refer_price)
+    if refer_price != journaled_state['referPrice']:
+        journal_append(grid, {'op': 'refer', 'price': refer_price})
+        journaled_state['referPrice'] = refer_price
+
+    last_trade = [grid.last_trade_side, fmt(grid.last_trade_qty)] if grid.last_trade_side else None
+    if last_trade != journaled_state['lastTrade']:
+        journal_append(grid, {'op': 'lastTrade', 'side': grid.last_trade_side, 'qty': fmt(grid.last_trade_qty)})
+        journaled_state['lastTrade'] = last_trade
+
+def fsync_write(path, text, mode='a'):
+    with open(path, mode, encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+
+def flush_state_journal(grid):
+    """批量写盘：每次网格更新结束时一次fsync落盘缓冲中的全部记录，记录数达到阈值时压缩为快照"""
+    if not grid.journal_buffer:
+        return
+
+    fsync_write(grid.journal_path, '\n'.join(grid.journal_buffer) + '\n')
+    grid.journal_buffer.clear()
+
+    if grid.journal_records_since_snapshot >= journalCompactEvery:
+        snapshot = {
+            'seq': grid.journal_seq,
+            'buyOrders': sorted(grid.journaled_state['buyOrders']),
+            'sellOrders': sorted(grid.journaled_state['sellOrders']),
+            'referPrice': grid.journaled_state['referPrice'],
+            'lastTrade': grid.journaled_state['lastTrade'],
+        }
+        tmp_path = grid.snapshot_path + '.tmp'
+        fsync_write(tmp_path, json.dumps(snapshot), mode='w')
+        os.replace(tmp_path, grid.snapshot_path)
+        fsync_write(grid.journal_path, '', mode='w')
+        grid.journal_records_since_snapshot = 0
+
+def load_grid_state(grid):
+    """读取快照并重放其后的日志；日志末尾因崩溃写了一半的记录直接忽略"""
+    state = {'seq': 0, 'buyOrders': set(), 'sellOrders': set(), 'referPrice': None, 'lastTrade': None}
+    if os.path.exists(grid.snapshot_path):
+        with open(grid.snapshot_path, encoding='utf-8') as f:
+            snapshot = json.load(f)
+        state.update(snapshot, buyOrders=set(snapshot['buyOrders']), sellOrders=set(snapshot['sellOrders']))
+
+    replayed = 0
+    if os.path.exists(grid.journal_path):
+        with open(grid.journal_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if record['seq'] <= state['seq']:
+                    continue
+                key = 'buyOrders' if record.get('side') == 'BUY' else 'sellOrders'
+                if record['op'] == 'add':
+                    state[key].add(record['orderId'])
+                elif record['op'] == 'remove':
+                    state[key].discard(record['orderId'])
+                elif record['op'] == 'refer':
+                    state['referPrice'] = record['price']
+                elif record['op'] == 'lastTrade':
+                    state['lastTrade'] = [record['side'], record['qty']] if record['side'] else None
+                state['seq'] = record['seq']
+                replayed += 1
+    return state, replayed
+
+def restore_grid_state(grid):
+    """启动时从日志恢复跟踪的挂单和参考价，随后的REST对账只需一次挂单查询即可继续运行"""
+    state, replayed = load_grid_state(grid)
+    grid.journal_seq = state['seq']
+    grid.journal_records_since_snapshot = replayed
+    grid.journaled_state.update(
+        buyOrders=set(state['buyOrders']),
+        sellOrders=set(state['sellOrders']),
+        referPrice=state['referPrice'],
+        lastTrade=state['lastTrade'],
+    )
+    if state['referPrice'] is None:
+        return False
+
+    grid.buy_orders.update(state['buyOrders'])
+    grid.sell_orders.update(state['sellOrders'])
+    grid.last_refer_price = to_decimal(state['referPrice'])
+    if state['lastTrade']:
+        grid.last_trade_side = state['lastTrade'][0]
+        grid.last_trade_qty = to_decimal(state['lastTrade'][1])
+    print(f"{grid.pair}从状态日志恢复: 买单{len(grid.buy_orders)}个 卖单{len(grid.sell_orders)}个 参考价{fmt(grid.last_refer_price)}")
+    return True
 
 def sign_websocket_params(params):
     payload = '&'.join(f"{key}={params[key]}" for key in sorted(params))
+    if ed25519_signer is not None:
+        return base64.b64encode(ed25519_signer.sign(payload.encode('utf-8'))).decode('utf-8')
     return hmac.new(api_secret.encode('utf-8'), payload.encode('utf-8'), hashlib.sha256).hexdigest()
 
-def parse_websocket_message(message):
-    if isinstance(message, str):
-        message = json.loads(message)
-    if isinstance(message, dict) and 'data' in message:
-        message = message['data']
-    if isinstance(message, dict) and 'event' in message:
-        message = message['event']
-    return message
+def register_message_routes():
+    """按(事件类型, 交易对)注册处理函数；没有注册的交易对、用不到的事件在解析JSON之前就被丢弃"""
+    user_stream_router.clear()
+    market_stream_router.clear()
+    user_stream_router.on_response = handle_websocket_response
+    for stream_router in [user_stream_router, market_stream_router]:
+        stream_router.on_parse = ws_parse_seconds.observe
+        stream_router.on_frame = ws_messages_total.inc
+    for grid in grids:
+        user_stream_router.add('executionReport', handle_execution_report, grid.pair)
+        market_stream_router.add('trade', handle_market_message, grid.pair, functools.partial(trade_crosses_trigger, grid))
+    user_stream_router.add('outboundAccountPosition', lambda _, data: apply_account_position(data))
+    user_stream_router.add('balanceUpdate', lambda _, data: apply_balance_update(data))
+    user_stream_router.add('eventStreamTerminated', handle_stream_terminated)
+    user_stream_router.add('serverShutdown', handle_stream_terminated)
+
+def send_websocket_request(method, params, signed=True):
+    """通过当前User Data Stream连接发送WebSocket API请求，返回等待响应的句柄；连接不可用时返回None"""
+    ws = active_user_ws
+    if ws is None or not user_stream_ready_event.is_set():
+        return None
 
-def handle_websocket_message(_, message):
+    if method in websocketRequestCosts:
+        priority, weight, orders = restRequestCosts[websocketRequestCosts[method]]
+        with rest_wait_seconds.time(priority):
+            rest_rate_limiter.acquire(priority, weight, orders)
+
+    params = dict(params)
+    if signed:
+        params['timestamp'] = int(time.time() * 1000)
+        if not session_logged_on_event.is_set():
+            params['apiKey'] = api_key
+            params['signature'] = sign_websocket_params(params)
+    request_id = f'req-{next(ws_api_request_ids)}'
+    pending = {'id': request_id, 'method': method, 'ws': ws, 'sentAt': time.perf_counter(), 'event': threading.Event(), 'response': None}
+    with ws_api_pending_lock:
+        ws_api_pending[request_id] = pending
     try:
-        data = parse_websocket_message(message)
-        if not isinstance(data, dict):
-            return
-
-        if data.get('id') == 'user-data-subscribe':
-            if data.get('status') == 200:
-                print(f"User Data Stream订阅成功: {data.get('result')}")
-                user_stream_ready_event.set()
-            else:
-                print(f"User Data Stream订阅失败: {data}")
-                ws_restart_event.set()
-            return
+        ws.send(json.dumps({'id': request_id, 'method': method, 'params': params}))
+    except Exception as e:
+        with ws_api_pending_lock:
+            ws_api_pending.pop(request_id, None)
+        print(f"WebSocket API请求发送失败: {method} {e}")
+        return None
+    return pending
+
+def wait_websocket_response(pending, timeout):
+    """等待请求响应；超时或连接中断时返回None"""
+    pending['event'].wait(timeout=max(timeout, 0))
+    with ws_api_pending_lock:
+        ws_api_pending.pop(pending['id'], None)
+    return pending['response']
+
+def resolve_websocket_response(data):
+    with ws_api_pending_lock:
+        pending = ws_api_pending.get(data.get('id'))
+    if not pending:
+        return False
+    ws_request_seconds.observe(time.perf_counter() - pending['sentAt'], pending['method'])
+    ws_requests_total.inc(pending['method'], str(data.get('status')))
+    if data.get('rateLimits'):
+        rest_rate_limiter.record_websocket_limits(data['rateLimits'])
+    if data.get('status') in rateLimitFallbackDelay:
+        rest_rate_limiter.ban(websocket_error(data))
+    pending['response'] = data
+    pending['event'].set()
+    return True
+
+def fail_pending_websocket_requests(ws):
+    """连接断开时唤醒在这条连接上等待的请求，由调用方回退REST"""
+    with ws_api_pending_lock:
+        pending_requests = [pending for pending in ws_api_pending.values() if pending['ws'] is ws]
+        for pending in pending_requests:
+            del ws_api_pending[pending['id']]
+    for pending in pending_requests:
+        pending['event'].set()
+
+def has_pending_websocket_requests(ws):
+    with ws_api_pending_lock:
+        return any(pending['ws'] is ws for pending in ws_api_pending.values())
+
+def is_duplicate_execution_report(data):
+    """同一成交（tradeId）或同一订单状态变化（无成交时用事件时间）只处理一次"""
+    trade_id = data.get('t', -1)
+    key = (data.get('i'), trade_id if trade_id != -1 else data.get('E'), data.get('X'))
+    with seen_execution_reports_lock:
+        if key in seen_execution_reports:
+            return True
+        seen_execution_reports[key] = None
+        if len(seen_execution_reports) > executionReportDedupSize:
+            seen_execution_reports.popitem(last=False)
+    return False
+
+def call_websocket_session(method, positional, args, kwargs):
+    """在已登录的WebSocket API会话上执行只读查询；会话未登录、连接不可用或超时时返回None，由调用方回退REST"""
+    if not session_logged_on_event.is_set():
+        return None
+    pending = send_websocket_request(method, dict(zip(positional, args), **kwargs))
+    if pending is None:
+        return None
+    response = wait_websocket_response(pending, websocketRequestTimeout)
+    if response is None:
+        return None
+    if response.get('status') != 200:
+        raise websocket_error(response)
+    return response['result']
 
-        event_type = data.get('e')
-        if event_type == 'executionReport' and data.get('s') == pair:
-            status = data.get('X')
-            order_id = int(data.get('i'))
-            print(f"订单事件: {data.get('S')} {status} orderId={order_id} lastQty={fmt(to_decimal(data.get('l')))} cumQty={fmt(to_decimal(data.get('z')))}")
-            if order_id in buy_orders + sell_orders:
-                if status not in ['FILLED', 'CANCELED', 'EXPIRED', 'EXPIRED_IN_MATCH', 'REJECTED']:
-                    return
-                push_terminal_order_event(data)
-                order_update_event.set()
-            return
+def websocket_error(response):
+    error = response.get('error') or {}
+    return ClientError(response.get('status'), error.get('code'), error.get('msg'), {}, error.get('data'))
 
-        if event_type in ['eventStreamTerminated', 'serverShutdown']:
-            print(f"WebSocket事件流结束: {event_type}")
-            ws_restart_event.set()
+def handle_websocket_message(ws, message):
+    try:
+        user_stream_router.dispatch(ws, message)
     except Exception as e:
         print(f"处理WebSocket消息失败: {e}")
         traceback.print_exc()
 
-def handle_websocket_error(_, error):
+def handle_websocket_response(ws, data):
+    """WebSocket API响应：在途请求、会话登录和User Data Stream订阅确认"""
+    if not isinstance(data, dict) or resolve_websocket_response(data):
+        return
+
+    if data.get('id') == 'session-logon':
+        if data.get('status') == 200:
+            print('WebSocket API会话登录成功')
+            connection_events(ws)[1].set()
+            ws.send(json.dumps({'id': 'user-data-subscribe', 'method': 'userDataStream.subscribe'}))
+        else:
+            print(f"WebSocket API会话登录失败: {data}")
+            if ws is active_user_ws:
+                ws_restart_event.set()
+        return
+
+    if data.get('id') == 'user-data-subscribe':
+        if data.get('status') == 200:
+            print(f"User Data Stream订阅成功: {data.get('result')}")
+            connection_events(ws)[0].set()
+        else:
+            print(f"User Data Stream订阅失败: {data}")
+            if ws is active_user_ws:
+                ws_restart_event.set()
+
+def handle_execution_report(_, data):
+    if is_duplicate_execution_report(data):
+        return
+    grid = grids_by_symbol[data['s']]
+    apply_execution_report(grid, data)
+    apply_order_update(data)
+    status = data.get('X')
+    order_id = int(data.get('i'))
+    print(f"订单事件: {grid.pair} {data.get('S')} {status} orderId={order_id} lastQty={fmt(to_decimal(data.get('l')))} cumQty={fmt(to_decimal(data.get('z')))}")
+    if status in terminal_order_statuses:
+        prepared = take_presumed_fill(grid, order_id)
+        if prepared:
+            confirm_presumed_fill(grid, order_id, prepared, status, to_decimal(data['z']), to_decimal(data['p']))
+            return
+    if is_tracked_order(grid, order_id):
+        if status not in terminal_order_statuses:
+            return
+        with event_enqueue_seconds.time():
+            push_terminal_order_event(grid, data)
+            notify_order_update()
+        trace_latency('received', grid, [order_id])
+    if grid.presumed_fills:
+        resolve_presumed_fills(grid, lookup=False)
+
+def handle_stream_terminated(_, data):
+    print(f"WebSocket事件流结束: {data.get('e')}")
+    ws_restart_event.set()
+
+def trace_latency(stage, grid, order_ids=()):
+    """成交到重挂各阶段的时间点：received、update_start、decided、placed；未挂回调时为空操作"""
+    if latency_trace_hook:
+        latency_trace_hook(stage, grid.pair, order_ids, time.perf_counter())
+
+def notify_order_update():
+    """唤醒主循环处理订单事件；asyncio模式下同时唤醒事件循环"""
+    order_update_event.set()
+    if async_order_update:
+        event_loop, event = async_order_update
+        event_loop.call_soon_threadsafe(event.set)
+
+def handle_websocket_error(ws, error):
+    if ws is not active_user_ws:
+        return
     print(f"WebSocket错误: {error}")
     ws_restart_event.set()
 
-def handle_websocket_close(*_):
+def handle_websocket_close(ws, *_):
+    if ws is not active_user_ws:
+        return
+    session_logged_on_event.clear()
+    fail_pending_websocket_requests(ws)
     if ws_stopping_event.is_set():
         return
     print('WebSocket连接关闭，准备重连')
     ws_restart_event.set()
 
-def subscribe_user_data_stream(ws):
+def user_data_subscribe_request():
     params = {
         'apiKey': api_key,
         'recvWindow': 5000,
         'timestamp': int(time.time() * 1000),
     }
     params['signature'] = sign_websocket_params(params)
-    ws.send(json.dumps({
+    return json.dumps({
         'id': 'user-data-subscribe',
         'method': 'userDataStream.subscribe.signature',
         'params': params,
-    }))
+    })
 
-def start_websocket_client():
+def session_logon_request():
+    params = {'apiKey': api_key, 'timestamp': int(time.time() * 1000)}
+    params['signature'] = sign_websocket_params(params)
+    return json.dumps({'id': 'session-logon', 'method': 'session.logon', 'params': params})
+
+def websocket_open_request():
+    """连接建立后的第一条请求：Ed25519密钥先session.logon，登录成功后再订阅；HMAC密钥直接签名订阅"""
+    return session_logon_request() if apiKeyType == 'ED25519' else user_data_subscribe_request()
+
+def subscribe_user_data_stream(ws):
+    ws.send(websocket_open_request())
+
+def connection_events(ws):
+    """(订阅确认, 会话登录)事件：活动连接用全局事件，轮换中的新连接用备用的一组，接管时再整体切换"""
+    if ws is standby_user_ws:
+        return standby_ready_event, standby_logged_on_event
+    return user_stream_ready_event, session_logged_on_event
+
+def websocket_connected(ws):
+    if isinstance(ws, AsyncWebSocketClient):
+        return ws.connection is not None
+    return ws.sock is not None and ws.sock.connected
+
+def can_rotate_websocket(user_ws):
+    """旧连接仍在正常收事件时才做先建后拆的轮换；已断开或订阅失败时直接重连"""
+    return user_ws is not None and user_ws is active_user_ws and user_stream_ready_event.is_set() and websocket_connected(user_ws)
+
+def promote_standby_websocket(new_ws):
+    """新连接确认订阅后接管请求；返回被替换下来的旧连接"""
+    global active_user_ws, standby_user_ws
+    old_ws = active_user_ws
+    active_user_ws = new_ws
+    standby_user_ws = None
+    user_stream_ready_event.set()
+    if standby_logged_on_event.is_set():
+        session_logged_on_event.set()
+    else:
+        session_logged_on_event.clear()
+    print('新User Data Stream连接已接管，关闭旧连接')
+    return old_ws
+
+def reset_websocket_events():
     ws_stopping_event.clear()
     ws_restart_event.clear()
     user_stream_ready_event.clear()
-    ws = WebSocketApp(
-        'wss://ws-api.binance.com:443/ws-api/v3?returnRateLimits=false',
+    session_logged_on_event.clear()
+
+def create_websocket_app():
+    from websocket import WebSocketApp
+    return WebSocketApp(
+        websocketApiUrl,
         on_open=subscribe_user_data_stream,
         on_message=handle_websocket_message,
         on_error=handle_websocket_error,
         on_close=handle_websocket_close,
     )
+
+def start_websocket_client():
+    global active_user_ws
+    reset_websocket_events()
+    ws = create_websocket_app()
+    active_user_ws = ws
     threading.Thread(target=ws.run_forever, name='user-data-websocket', daemon=True).start()
     print('User Data Stream WebSocket已启动')
     return ws, time.time()
 
+def start_standby_websocket_client():
+    global standby_user_ws
+    standby_ready_event.clear()
+    standby_logged_on_event.clear()
+    ws = create_websocket_app()
+    standby_user_ws = ws
+    threading.Thread(target=ws.run_forever, name='user-data-websocket', daemon=True).start()
+    print('新User Data Stream WebSocket已启动，等待订阅确认后接管')
+    return ws
+
+def discard_standby_websocket(ws):
+    global standby_user_ws
+    standby_user_ws = None
+    try:
+        ws.close()
+    except Exception as e:
+        print(f"停止WebSocket失败: {e}")
+
+def rotate_websocket_client(user_ws):
+    """先建后拆：新连接确认订阅后才接管，旧连接等在途请求返回后再关闭；期间两条连接都在收事件，
+    重复的executionReport去重。新连接未能确认时返回None"""
+    new_ws = start_standby_websocket_client()
+    if not standby_ready_event.wait(timeout=10):
+        print('新User Data Stream订阅确认超时，改为断开重连')
+        discard_standby_websocket(new_ws)
+        return None
+    old_ws = promote_standby_websocket(new_ws)
+    deadline = time.time() + websocketRequestTimeout
+    while has_pending_websocket_requests(old_ws) and time.time() < deadline:
+        time.sleep(0.01)
+    stop_websocket_client(old_ws)
+    return new_ws, time.time()
+
 def start_ready_websocket_client(user_ws=None, attempts=3):
+    if can_rotate_websocket(user_ws):
+        rotated = rotate_websocket_client(user_ws)
+        if rotated:
+            return rotated
+
+    # 旧连接已断开（或轮换失败）：断开期间的事件可能丢失，本地状态在重连后重新校准
+    invalidate_balance_ledger()
+    invalidate_order_states()
     if user_ws:
         stop_websocket_client(user_ws)
-        time.sleep(1)
 
     for attempt in range(attempts):
         user_ws, started_at = start_websocket_client()
@@ -350,197 +1582,797 @@ def start_ready_websocket_client(user_ws=None, attempts=3):
     raise RuntimeError('User Data Stream订阅确认超时')
 
 def stop_websocket_client(user_ws):
+    """关闭连接；只有关闭的是活动连接时才标记为主动停止，轮换下来的旧连接关闭不影响新连接的断线重连"""
+    global active_user_ws
     if not user_ws:
         return
 
-    ws_stopping_event.set()
+    if active_user_ws is user_ws:
+        ws_stopping_event.set()
+        active_user_ws = None
+        session_logged_on_event.clear()
+    fail_pending_websocket_requests(user_ws)
     try:
         user_ws.close()
     except Exception as e:
         print(f"停止WebSocket失败: {e}")
 
-def place_order(side, quantity, price):
-    """挂单函数"""
+class AsyncWebSocketClient:
+    """asyncio模式下的User Data Stream连接；send/close可以从网格更新线程调用"""
+
+    def __init__(self, event_loop):
+        self.event_loop = event_loop
+        self.connection = None
+        self.task = event_loop.create_task(self.run())
+
+    async def run(self):
+        import websockets
+
+        try:
+            async with websockets.connect(websocketApiUrl) as connection:
+                self.connection = connection
+                await connection.send(websocket_open_request())
+                async for message in connection:
+                    handle_websocket_message(self, message)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            handle_websocket_error(self, e)
+        finally:
+            self.connection = None
+            handle_websocket_close(self)
+
+    def send(self, text):
+        if self.connection is None:
+            raise ConnectionError('WebSocket未连接')
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self.event_loop:
+            # 在事件循环内（消息处理回调里）发送时不能阻塞等待
+            self.event_loop.create_task(self.connection.send(text))
+            return
+        future = asyncio.run_coroutine_threadsafe(self.connection.send(text), self.event_loop)
+        future.result(timeout=websocketRequestTimeout)
+
+    def close(self):
+        self.event_loop.call_soon_threadsafe(self.task.cancel)
+
+async def rotate_async_websocket_client(user_ws):
+    """asyncio模式下的先建后拆轮换，流程同rotate_websocket_client"""
+    global standby_user_ws
+    standby_ready_event.clear()
+    standby_logged_on_event.clear()
+    new_ws = AsyncWebSocketClient(asyncio.get_running_loop())
+    standby_user_ws = new_ws
+    print('新User Data Stream WebSocket已启动，等待订阅确认后接管')
+    if not await asyncio.to_thread(standby_ready_event.wait, 10):
+        print('新User Data Stream订阅确认超时，改为断开重连')
+        discard_standby_websocket(new_ws)
+        return None
+    old_ws = promote_standby_websocket(new_ws)
+    deadline = time.time() + websocketRequestTimeout
+    while has_pending_websocket_requests(old_ws) and time.time() < deadline:
+        await asyncio.sleep(0.01)
+    stop_websocket_client(old_ws)
+    return new_ws, time.time()
+
+async def start_ready_async_websocket_client(user_ws=None, attempts=3):
+    global active_user_ws
+    if can_rotate_websocket(user_ws):
+        rotated = await rotate_async_websocket_client(user_ws)
+        if rotated:
+            return rotated
+
+    invalidate_balance_ledger()
+    invalidate_order_states()
+    if user_ws:
+        stop_websocket_client(user_ws)
+
+    for attempt in range(attempts):
+        reset_websocket_events()
+        user_ws = AsyncWebSocketClient(asyncio.get_running_loop())
+        active_user_ws = user_ws
+        print('User Data Stream WebSocket已启动')
+        if await asyncio.to_thread(user_stream_ready_event.wait, 10):
+            return user_ws, time.time()
+
+        print(f"User Data Stream订阅确认超时，准备重试... (尝试 {attempt + 1}/{attempts})")
+        stop_websocket_client(user_ws)
+        await asyncio.sleep(3)
+
+    raise RuntimeError('User Data Stream订阅确认超时')
+
+def new_client_order_id():
+    return f"{clientOrderPrefix}-{int(time.time() * 1000)}-{next(client_order_ids)}"
+
+def build_order_params(grid, side, qty_steps, price_ticks):
+    """梯子里的价格和数量是tickSize/stepSize的整数倍，只在提交订单时转成字符串"""
+    return {
+        'symbol': grid.pair,
+        'side': side,
+        'type': 'LIMIT',
+        'timeInForce': 'GTC',
+        'quantity': ladder_engine.format_units(qty_steps, grid.quantity_quantum),
+        'price': ladder_engine.format_units(price_ticks, grid.price_quantum),
+        'newClientOrderId': new_client_order_id(),
+    }
+
+def build_replace_params(grid, order_id, side, qty_steps, price_ticks):
+    params = build_order_params(grid, side, qty_steps, price_ticks)
+    params['cancelReplaceMode'] = 'STOP_ON_FAILURE'
+    params['cancelOrderId'] = int(order_id)
+    return params
+
+def report_order_error(error):
+    if isinstance(error, ClientError):
+        send_message(f"挂单失败!\nerror_code: {error.error_code}\nerror_message: {error.error_message}")
+    elif isinstance(error, ServerError):
+        send_message(f"挂单服务器错误！\n{error.message}")
+    else:
+        print(f"挂单时发生未知错误: {error}")
+        send_message(f"挂单时发生未知错误: {error}")
+
+def record_cancel_replace_error(error):
+    """撤换部分失败（409 -2021）时旧单已撤销，按错误数据里的cancelResponse更新本地订单状态"""
+    data = error.error_data if isinstance(error, ClientError) and isinstance(error.error_data, dict) else {}
+    if data.get('cancelResult') == 'SUCCESS' and data.get('cancelResponse'):
+        record_order_state(data['cancelResponse'])
+
+def send_order_request_rest(method, params):
+    """REST下单/撤换（WebSocket不可用时的回退路径）"""
     try:
-        order = client.new_order(
-            symbol=pair,
-            side=side,
-            type='LIMIT',
-            timeInForce='GTC',
-            quantity=format(quantize_quantity(quantity), 'f'),
-            price=format(quantize_price(price), 'f')
-        )
-        return order
+        if method == 'order.cancelReplace':
+            return client.cancel_and_replace(**params)
+        return client.new_order(**params)
+    except Exception as e:
+        record_cancel_replace_error(e)
+        report_order_error(e)
+        return None
+
+def cancel_order_rest(grid, order_id):
+    try:
+        record_order_state(client.cancel_order(symbol=grid.pair, orderId=int(order_id)))
     except ClientError as e:
-        send_message(f"挂单失败!\nerror_code: {e.error_code}\nerror_message: {e.error_message}")
+        # -2011: 订单已成交或已撤销，无需再撤
+        if e.error_code != -2011:
+            raise
+
+def recover_order_request(grid, method, params):
+    """WebSocket请求未确认时按clientOrderId查询，确认未挂出再走REST，避免重复挂单"""
+    try:
+        return client.get_order(symbol=grid.pair, origClientOrderId=params['newClientOrderId'])
+    except ClientError as e:
+        if e.error_code != -2013:
+            report_order_error(e)
+            return None
+    except Exception as e:
+        report_order_error(e)
         return None
-    except ServerError as e:
-        send_message(f"挂单服务器错误！\n{e.message}")
+
+    print(f"WebSocket请求未确认，回退REST: {method} {params['side']} {params['quantity']}@{params['price']}")
+    if method == 'order.cancelReplace':
+        params = dict(params)
+        params.pop('cancelReplaceMode')
+        try:
+            cancel_order_rest(grid, params.pop('cancelOrderId'))
+        except Exception as e:
+            report_order_error(e)
+            return None
+    return send_order_request_rest('order.place', params)
+
+def submit_order_requests(grid, requests):
+    """流水线发送一批order.place/order.cancelReplace请求，按请求id收集响应；WebSocket不可用或未确认时逐个回退REST"""
+    submitted = []
+    for method, params in requests:
+        pending = send_websocket_request(method, params) if websocketOrderEntry else None
+        submitted.append((method, params, pending))
+
+    deadline = time.time() + websocketRequestTimeout
+    results = []
+    for method, params, pending in submitted:
+        if pending is None:
+            order = send_order_request_rest(method, params)
+        else:
+            response = wait_websocket_response(pending, deadline - time.time())
+            if response is None:
+                order = recover_order_request(grid, method, params)
+            elif response.get('status') == 200:
+                order = response['result']
+            else:
+                error = websocket_error(response)
+                record_cancel_replace_error(error)
+                report_order_error(error)
+                order = None
+        if order and 'newOrderResponse' in order:
+            record_order_state(order['cancelResponse'])
+            order = order['newOrderResponse']
+        if order:
+            record_order_state(order)
+        results.append(order)
+    return results
+
+def cancel_orders(grid, order_ids):
+    """批量撤单：order.cancel流水线发送，未确认的订单逐个用REST撤销"""
+    if not order_ids:
+        return
+    pending_requests = []
+    for order_id in order_ids:
+        pending = send_websocket_request('order.cancel', {'symbol': grid.pair, 'orderId': int(order_id)}) if websocketOrderEntry else None
+        pending_requests.append((order_id, pending))
+
+    deadline = time.time() + websocketRequestTimeout
+    for order_id, pending in pending_requests:
+        response = wait_websocket_response(pending, deadline - time.time()) if pending else None
+        if response is None:
+            cancel_order_rest(grid, order_id)
+        elif response.get('status') == 200:
+            record_order_state(response['result'])
+        else:
+            error = websocket_error(response)
+            if error.error_code != -2011:
+                raise error
+
+def diff_ladder(grid, ladder, live_orders):
+    """对比目标梯子和现有挂单：方向、价格、数量一致的保留；同方向多余和缺少的配对撤换；其余撤销或新挂"""
+    unmatched = {}
+    for order in live_orders:
+        key = (
+            order['side'],
+            ladder_engine.to_units(order['price'], grid.price_quantum),
+            ladder_engine.to_units(order['origQty'], grid.quantity_quantum),
+        )
+        unmatched.setdefault(key, []).append(order)
+
+    kept = []
+    missing = []
+    for side, qty, price in ladder:
+        orders = unmatched.get((side, price, qty))
+        if orders:
+            kept.append((side, qty, price, orders.pop()))
+        else:
+            missing.append((side, qty, price))
+
+    stale = [order for orders in unmatched.values() for order in orders]
+    replaced = []
+    placed = []
+    for side, qty, price in missing:
+        order = next((order for order in stale if order['side'] == side), None)
+        if order:
+            stale.remove(order)
+            replaced.append((side, qty, price, order))
+        else:
+            placed.append((side, qty, price))
+    return kept, stale, replaced, placed
+
+def plan_ladder_changes(grid, ladder, live_orders):
+    """把目标梯子和现有挂单的差异整理成待发送的撤单和下单请求"""
+    kept, stale, replaced, placed = diff_ladder(grid, ladder, live_orders)
+    return {
+        'kept': [(side, order['orderId']) for side, qty, price, order in kept],
+        'stale': [order['orderId'] for order in stale],
+        'requests': [
+            ('order.cancelReplace', build_replace_params(grid, order['orderId'], side, qty, price))
+            for side, qty, price, order in replaced
+        ] + [
+            ('order.place', build_order_params(grid, side, qty, price))
+            for side, qty, price in placed
+        ],
+        'rungs': [(side, qty, price) for side, qty, price, _ in replaced] + placed,
+        'summary': f"保留{len(kept)} 撤销{len(stale)} 撤换{len(replaced)} 新挂{len(placed)}",
+    }
+
+def rebuild_ladder(grid, ladder, live_orders):
+    """增量重建网格：只撤销、撤换或新挂发生变化的档位，其余挂单原样保留"""
+    apply_ladder_changes(grid, plan_ladder_changes(grid, ladder, live_orders))
+
+def apply_ladder_changes(grid, changes):
+    trace_latency('decided', grid)
+    print(f"{grid.pair}增量更新挂单: {changes['summary']}")
+
+    for side, order_id in changes['kept']:
+        (grid.buy_orders if side == 'BUY' else grid.sell_orders).add(order_id)
+
+    cancel_orders(grid, changes['stale'])
+
+    results = submit_order_requests(grid, changes['requests'])
+    trace_latency('placed', grid)
+    for (side, qty, price), order in zip(changes['rungs'], results):
+        if not order:
+            continue
+        price = fmt(ladder_engine.from_units(price, grid.price_quantum))
+        qty = fmt(ladder_engine.from_units(qty, grid.quantity_quantum))
+        if side == 'BUY':
+            print(f'在{price}买入{qty}{grid.base_asset}挂单成功')
+            grid.buy_orders.add(order['orderId'])
+        else:
+            print(f'在{price}卖出{qty}{grid.base_asset}挂单成功')
+            grid.sell_orders.add(order['orderId'])
+
+def report_ladder_stops(grid, rungs, quote_balance, base_balance):
+    """梯子在某一档停止时的提示：低于最小名义金额或余额不足"""
+    tick_step = grid.price_quantum * grid.quantity_quantum
+    for side, stop in [('BUY', rungs['buyStop']), ('SELL', rungs['sellStop'])]:
+        if stop is None:
+            continue
+        reason, price_ticks, qty_steps = stop
+        price = ladder_engine.from_units(price_ticks, grid.price_quantum)
+        qty = ladder_engine.from_units(qty_steps, grid.quantity_quantum)
+        if reason == 'min_notional':
+            send_message(f"订单金额: {fmt(price * qty)}，低于最小名义金额: {fmt(grid.min_notional)}")
+        elif side == 'BUY':
+            remaining = quote_balance - rungs['quoteUsed'] * tick_step
+            send_message(f"{grid.quote_asset}余额: {fmt(remaining)}，无法在{fmt(price)}买入{fmt(qty)}{grid.base_asset}")
+        else:
+            remaining = base_balance - ladder_engine.from_units(rungs['baseUsed'], grid.quantity_quantum)
+            print(f"{grid.base_asset}余额: {fmt(remaining)}，无法在{fmt(price)}卖出{fmt(qty)}{grid.base_asset}")
+
+def nearest_order(grid, side):
+    """该方向离参考价最近的跟踪挂单：买单取最高价，卖单取最低价"""
+    order_ids = grid.buy_orders if side == 'BUY' else grid.sell_orders
+    with order_states_lock:
+        orders = [
+            order_states[order_id] for order_id in order_ids
+            if order_id in order_states and order_states[order_id]['status'] in open_order_statuses
+        ]
+    if not orders:
         return None
+    return dict(max(orders, key=lambda order: order['price']) if side == 'BUY' else min(orders, key=lambda order: order['price']))
+
+def clear_prepared_ladders(grid):
+    grid.prepared_ladders = {}
+    grid.speculative_triggers = (None, None)
+
+def prepare_next_ladders(grid, refer_price, quote_balance, base_balance):
+    """预先算好最近一档买单或卖单成交后的参考价、余额、下一组网格，以及相对当前挂单的撤换请求"""
+    clear_prepared_ladders(grid)
+    fee_rate = Decimal(str(speculativeFeeRate))
+    live_orders = live_order_states(grid)
+    prepared_ladders = {}
+    for side in ['BUY', 'SELL']:
+        order = nearest_order(grid, side)
+        if order is None:
+            continue
+        price, qty = order['price'], order['origQty']
+        if side == 'BUY':
+            next_quote, next_base = quote_balance - price * qty, base_balance + qty * (1 - fee_rate)
+        else:
+            next_quote, next_base = quote_balance + price * qty * (1 - fee_rate), base_balance - qty
+        next_refer = grid_core.move_refer_price(refer_price, side, grid.price_step)
+        rungs = grid_core.plan_ladder(grid.params, grid.filters, next_refer, side, qty, next_quote, next_base)
+        ladder = [('BUY', qty, price) for price, qty in rungs['buy']] + [('SELL', qty, price) for price, qty in rungs['sell']]
+        remaining = [live for live in live_orders if live['orderId'] != order['orderId']]
+        prepared_ladders[side] = {
+            'orderId': order['orderId'],
+            'side': side,
+            'price': price,
+            'qty': qty,
+            'since': order['updateTime'],
+            'referPrice': next_refer,
+            'quoteBalance': next_quote,
+            'baseBalance': next_base,
+            'ladder': ladder,
+            'liveOrderIds': {live['orderId'] for live in remaining},
+            'changes': plan_ladder_changes(grid, ladder, remaining),
+        }
+    grid.prepared_ladders = prepared_ladders
+    grid.speculative_triggers = tuple(
+        float(prepared_ladders[side]['price']) if side in prepared_ladders else None for side in ['BUY', 'SELL']
+    )
+
+def fire_prepared_ladder(grid, side, trade):
+    """成交价已穿过最近一档挂单价格，按价格优先该挂单必然已全部成交：不等成交回报，直接发出预先准备好的请求。
+    网格正在更新时跳过，由正常的成交回报流程处理"""
+    if not grid.update_lock.acquire(blocking=False):
+        return
+    try:
+        prepared = grid.prepared_ladders.get(side)
+        if not prepared or int(trade['T']) <= prepared['since'] or not is_tracked_order(grid, prepared['orderId']):
+            return
+        order_id = prepared['orderId']
+        # 检查订单仍在挂和登记预判在同一把锁内完成：成交回报要么先到（这里看到终态，走普通流程），要么后到（按预判确认）
+        with presumed_fills_lock:
+            state = get_order_state(order_id)
+            if state is None or state['status'] not in open_order_statuses:
+                return
+            live_orders = [order for order in live_order_states(grid) if order['orderId'] != order_id]
+            live_order_ids = {order['orderId'] for order in live_orders}
+            if (grid.buy_orders | grid.sell_orders) - live_order_ids - {order_id}:
+                return  # 其他跟踪挂单也已结束（一次穿过多档），交给正常的成交回报流程统一处理
+            grid.presumed_fills[order_id] = dict(prepared, presumedAt=time.time())
+
+        trace_latency('received', grid, [order_id])
+        trace_latency('update_start', grid, [order_id])
+        clear_prepared_ladders(grid)
+        print(f"{grid.pair}成交价{trade['p']}穿过{fmt(prepared['price'])}，预判{side}挂单{order_id}已成交，直接挂出预先算好的网格")
+
+        changes = prepared['changes']
+        if live_order_ids != prepared['liveOrderIds']:
+            changes = plan_ladder_changes(grid, prepared['ladder'], live_orders)
+        grid.buy_orders.clear()
+        grid.sell_orders.clear()
+        grid.last_refer_price = quantize_price(grid, prepared['referPrice'])
+        grid.last_trade_side = side
+        grid.last_trade_qty = prepared['qty']
+        apply_ladder_changes(grid, changes)
+        prepare_next_ladders(grid, grid.last_refer_price, prepared['quoteBalance'], prepared['baseBalance'])
     except Exception as e:
-        print(f"挂单时发生未知错误: {e}")
-        send_message(f"挂单时发生未知错误: {e}")
-        return None
+        grid.needs_resync = True
+        notify_order_update()
+        print(f"{grid.pair}预判挂单失败，按最近成交重新同步网格: {e}")
+        traceback.print_exc()
+    finally:
+        journal_grid_state(grid)
+        flush_state_journal(grid)
+        grid.update_lock.release()
+
+def take_presumed_fill(grid, order_id):
+    """取走一笔预判成交；同一笔只会被成交回报、对账或超时查询中的一方取走"""
+    with presumed_fills_lock:
+        return grid.presumed_fills.pop(order_id, None)
+
+def confirm_presumed_fill(grid, order_id, prepared, status, qty, price):
+    """预判成交的订单确认了终态：成交则补发成交通知；否则标记网格需要按最近成交重新同步"""
+    if status == 'FILLED':
+        send_message(f"{prepared['side']} {fmt(quantize_quantity(grid, qty))}{grid.base_asset} at {fmt(quantize_price(grid, price))}")
+        return
+    print(f"{grid.pair}预判成交的订单{order_id}实际状态为{status}，按最近成交重新同步网格")
+    grid.needs_resync = True
+    notify_order_update()
 
-def update_orders():
-    """更新挂单"""
-    global buy_orders, sell_orders, last_refer_price
+def has_stale_presumed_fills(grid):
+    now = time.time()
+    return any(now - prepared['presumedAt'] >= presumedFillTimeout for prepared in list(grid.presumed_fills.values()))
 
+def resolve_presumed_fills(grid, lookup=True):
+    """终态已经记录下来（成交回报走了普通流程、REST对账）的预判成交直接确认；
+    lookup=True时超过presumedFillTimeout仍无终态的按订单查询结果确认，查询仍在挂也按未成交处理"""
+    now = time.time()
+    for order_id, prepared in list(grid.presumed_fills.items()):
+        state = get_order_state(order_id)
+        if state is None or state['status'] not in terminal_order_statuses:
+            if not lookup or now - prepared['presumedAt'] < presumedFillTimeout:
+                continue
+            prepared['presumedAt'] = now  # 查询失败时等下一个超时周期再试
+            state = lookup_order(grid, order_id)
+        prepared = take_presumed_fill(grid, order_id)
+        if prepared:
+            confirm_presumed_fill(grid, order_id, prepared, state['status'], to_decimal(state['executedQty']), to_decimal(state['price']))
+
+def reset_speculative_state(grid):
+    """放弃按预判建立的跟踪状态：不跟踪任何挂单时update_orders会按最近成交确定参考价，并对照实际挂单增量重建。
+    超时仍未确认的预判成交一并丢弃，重建以实际成交为准"""
+    resolve_presumed_fills(grid, lookup=False)
+    now = time.time()
+    for order_id, prepared in list(grid.presumed_fills.items()):
+        if now - prepared['presumedAt'] >= presumedFillTimeout and take_presumed_fill(grid, order_id):
+            print(f"{grid.pair}预判成交的订单{order_id}未确认，随重新同步一并丢弃")
+    grid.needs_resync = False
+    grid.buy_orders.clear()
+    grid.sell_orders.clear()
+    clear_prepared_ladders(grid)
+
+def trade_crosses_trigger(grid, text):
+    """解析前的过滤：从原始文本里取出成交价与最近一档的触发价比较，没有穿过的成交不做JSON解析"""
+    buy_trigger, sell_trigger = grid.speculative_triggers
+    if buy_trigger is None and sell_trigger is None:
+        return False
+    price = message_router.string_field(text, trade_price_field)
+    if price is None:
+        return True
+    price = float(price)
+    return (buy_trigger is not None and price < buy_trigger) or (sell_trigger is not None and price > sell_trigger)
+
+def handle_market_message(_, data):
+    """公开成交流：触发价可能在过滤之后变化，解析后再比较一次，命中时才进入预判下单"""
+    grid = grids_by_symbol[data['s']]
+    buy_trigger, sell_trigger = grid.speculative_triggers
+    price = float(data['p'])
+    if buy_trigger is not None and price < buy_trigger:
+        fire_prepared_ladder(grid, 'BUY', data)
+    elif sell_trigger is not None and price > sell_trigger:
+        fire_prepared_ladder(grid, 'SELL', data)
+
+def handle_market_stream_message(ws, message):
+    try:
+        market_stream_router.dispatch(ws, message)
+    except Exception as e:
+        print(f"处理公开成交流消息失败: {e}")
+        traceback.print_exc()
+
+def run_market_stream():
+    from websocket import WebSocketApp
+    streams = '/'.join(f'{grid.pair.lower()}@trade' for grid in grids)
+    while True:
+        ws = WebSocketApp(f'{marketStreamUrl}/stream?streams={streams}', on_message=handle_market_stream_message)
+        ws.run_forever()
+        print('公开成交流连接断开，5秒后重连')
+        time.sleep(5)
+
+def start_market_stream():
+    if not (speculativeOrders and tradingEnabled):
+        return
+    threading.Thread(target=run_market_stream, name='market-stream', daemon=True).start()
+    print('公开成交流WebSocket已启动')
+
+def update_orders(grid, reconcile=False):
+    """更新一个交易对的挂单；reconcile=True时用REST挂单快照校准本地订单状态，否则完全依赖WebSocket事件维护的本地状态"""
+    with grid.update_lock:
+        if grid.needs_resync:
+            reset_speculative_state(grid)
+        update_orders_locked(grid, reconcile)
+
+def update_orders_locked(grid, reconcile):
+    started = time.perf_counter()
     processed_event_order_ids = []
     try:
-        tracked_order_ids = set(buy_orders + sell_orders)
+        if grid.presumed_fills:
+            resolve_presumed_fills(grid)
+        tracked_order_ids = grid.buy_orders | grid.sell_orders
         terminal_events = [
-            event for event in snapshot_terminal_order_events()
-            if event['orderId'] in tracked_order_ids
+            event for event in snapshot_terminal_order_events(grid)
+            if event.orderId in tracked_order_ids
         ]
-        processed_event_order_ids = [event['orderId'] for event in terminal_events]
-
-        balance = get_balance()
-        base_balance = balance[baseAsset]['free'] + balance[baseAsset]['locked']
-        quote_balance = balance[quoteAsset]['free'] + balance[quoteAsset]['locked']
-
-        open_orders = client.get_open_orders(symbol=pair)
-        open_orders = [order['orderId'] for order in open_orders]
+        processed_event_order_ids = [event.orderId for event in terminal_events]
+        trace_latency('update_start', grid, processed_event_order_ids)
+
+        terminal_event_by_id = {event.orderId: event for event in terminal_events}
+        last_trade_read = None
+        if reconcile or not grid.order_states_synced:
+            snapshot_started_at = int(time.time() * 1000)
+            # 挂单快照、账户余额和（没有跟踪中的挂单时必然要用的）最近成交互不依赖，并发请求
+            open_orders_read = rest_read_executor.submit(client.get_open_orders, symbol=grid.pair)
+            balance_read = None if balance_ledger_seeded else rest_read_executor.submit(seed_balance_ledger)
+            if not tracked_order_ids:
+                last_trade_read = rest_read_executor.submit(get_last_trade_summary, grid.pair)
+            sync_open_order_states(grid, open_orders_read.result())
+            grid.last_verified_at = snapshot_started_at
+            if balance_read:
+                balance_read.result()
+        live_orders = [
+            order for order in live_order_states(grid)
+            if order['orderId'] not in terminal_event_by_id
+        ]
+        open_orders = [order['orderId'] for order in live_orders]
 
-        terminal_event_by_id = {event['orderId']: event for event in terminal_events}
         closed_orders = tracked_order_ids - set(open_orders)
         closed_orders.update(terminal_event_by_id.keys())
 
         if not closed_orders:
-            if sell_orders or buy_orders:
-                print('等待挂单成交...')
+            if grid.sell_orders or grid.buy_orders:
+                print(f'{grid.pair}等待挂单成交...')
                 return
 
-            last_trade = get_last_trade_summary(pair)
+            last_trade = last_trade_read.result() if last_trade_read else get_last_trade_summary(grid.pair)
             if not last_trade:
-                defer_terminal_order_events(processed_event_order_ids)
+                defer_terminal_order_events(grid, processed_event_order_ids)
                 return
 
-            last_trade_side = last_trade['side']
-            last_trade_qty = last_trade['qty']
-            refer_price = format_price(last_trade['price'])
+            grid.last_trade_side = last_trade['side']
+            grid.last_trade_qty = last_trade['qty']
+            refer_price = format_price(grid, last_trade['price'])
         else:
-            refer_price = last_refer_price
+            refer_price = grid.last_refer_price
             filled_message = ''
             last_trade_time = 0
             processed_fills = 0
+            order_infos = lookup_orders(grid, [order for order in closed_orders if int(order) not in terminal_event_by_id])
 
             for order in closed_orders:
                 event = terminal_event_by_id.get(int(order))
                 if event:
-                    if event['status'] != 'FILLED':
+                    if event.status != 'FILLED':
                         continue
-                    filled_trade_side = event['side']
-                    filled_trade_qty = quantize_quantity(event['qty'])
-                    filled_trade_price = quantize_price(event['price'])
-                    filled_time = event['time']
+                    filled_trade_side = event.side
+                    filled_trade_qty = quantize_quantity(grid, event.qty)
+                    filled_trade_price = quantize_price(grid, event.price)
+                    filled_time = event.time
                 else:
-                    order_info = client.get_order(symbol=pair, orderId=int(order))
+                    order_info = order_infos[order]
                     if order_info['status'] != 'FILLED':
                         continue
                     filled_trade_side = order_info['side']
-                    filled_trade_qty = quantize_quantity(order_info['executedQty'])
-                    filled_trade_price = quantize_price(order_info['price'])
+                    filled_trade_qty = quantize_quantity(grid, order_info['executedQty'])
+                    filled_trade_price = quantize_price(grid, order_info['price'])
                     filled_time = int(order_info['updateTime'])
 
                 processed_fills += 1
-                filled_message += f"{filled_trade_side} {fmt(filled_trade_qty)}{baseAsset} at {fmt(filled_trade_price)}\n"
-                if filled_trade_side == 'BUY':
-                    refer_price -= price_step
-                else:
-                    refer_price += price_step
+                filled_message += f"{filled_trade_side} {fmt(filled_trade_qty)}{grid.base_asset} at {fmt(filled_trade_price)}\n"
+                refer_price = grid_core.move_refer_price(refer_price, filled_trade_side, grid.price_step)
 
                 if filled_time > last_trade_time:
                     last_trade_time = filled_time
-                    last_trade_side = filled_trade_side
-                    last_trade_qty = filled_trade_qty
+                    grid.last_trade_side = filled_trade_side
+                    grid.last_trade_qty = filled_trade_qty
 
-            if processed_fills == 0:
-                last_trade = get_last_trade_summary(pair)
+            if processed_fills == 0 and grid.last_trade_side is None:
+                last_trade = get_last_trade_summary(grid.pair)
                 if not last_trade:
-                    defer_terminal_order_events(processed_event_order_ids)
+                    defer_terminal_order_events(grid, processed_event_order_ids)
                     return
-                last_trade_side = last_trade['side']
-                last_trade_qty = last_trade['qty']
+                grid.last_trade_side = last_trade['side']
+                grid.last_trade_qty = last_trade['qty']
 
-        if open_orders and tradingEnabled:
-            client.cancel_open_orders(symbol=pair)
-        elif open_orders:
-            print('只读预演模式，跳过取消现有挂单')
+        base_balance, quote_balance = grid_balances(grid)
 
         if closed_orders and filled_message:
             send_message(filled_message.strip())
 
-        buy_orders.clear()
-        sell_orders.clear()
+        grid.buy_orders.clear()
+        grid.sell_orders.clear()
 
-        if last_trade_side == 'BUY':
-            initial_buy_qty = last_trade_qty + buy_increment
-        else:
-            initial_buy_qty = initial_buy_quantity
-
-        for i in range(numOrders):
-            buy_price = quantize_price(refer_price - (i + 1) * price_step)
-            buy_qty = quantize_quantity(initial_buy_qty + i * buy_increment)
-            required_quote = buy_price * buy_qty
-            if not has_min_notional(buy_price, buy_qty):
-                send_message(f"订单金额: {fmt(required_quote)}，低于最小名义金额: {fmt(min_notional)}")
-                break
-            quote_balance = refresh_balance_if_needed(quoteAsset, quote_balance, required_quote)
-            if quote_balance < required_quote:
-                send_message(f"{quoteAsset}余额: {fmt(quote_balance)}，无法在{fmt(buy_price)}买入{fmt(buy_qty)}{baseAsset}")
-                break
-            if not tradingEnabled:
-                print(f'在{fmt(buy_price)}买入{fmt(buy_qty)}{baseAsset}挂单成功')
-                continue
-            order = place_order('BUY', buy_qty, buy_price)
-            if order:
-                print(f'在{fmt(buy_price)}买入{fmt(buy_qty)}{baseAsset}挂单成功')
-                buy_orders.append(order['orderId'])
-                quote_balance -= required_quote
-
-        for i in range(numOrders):
-            sell_price = quantize_price(refer_price + (i + 1) * price_step)
-            if not has_min_notional(sell_price, sell_quantity):
-                send_message(f"订单金额: {fmt(sell_price * sell_quantity)}，低于最小名义金额: {fmt(min_notional)}")
-                break
-            base_balance = refresh_balance_if_needed(baseAsset, base_balance, sell_quantity)
-            if base_balance < sell_quantity:
-                print(f"{baseAsset}余额: {fmt(base_balance)}，无法在{fmt(sell_price)}卖出{fmt(sell_quantity)}{baseAsset}")
-                break
-            if not tradingEnabled:
-                print(f'在{fmt(sell_price)}卖出{fmt(sell_quantity)}{baseAsset}挂单成功')
-                continue
-            order = place_order('SELL', sell_quantity, sell_price)
-            if order:
-                print(f'在{fmt(sell_price)}卖出{fmt(sell_quantity)}{baseAsset}挂单成功')
-                sell_orders.append(order['orderId'])
-                base_balance -= sell_quantity
+        rungs = grid_core.plan_ladder(
+            grid.params, grid.filters, refer_price, grid.last_trade_side, grid.last_trade_qty, quote_balance, base_balance,
+        )
+        report_ladder_stops(grid, rungs, quote_balance, base_balance)
+        ladder = [('BUY', qty, price) for price, qty in rungs['buy']] + [('SELL', qty, price) for price, qty in rungs['sell']]
 
-        last_refer_price = quantize_price(refer_price)
-        discard_terminal_order_events(processed_event_order_ids)
-        prune_stale_terminal_order_events()
+        if tradingEnabled:
+            rebuild_ladder(grid, ladder, live_orders)
+            if speculativeOrders:
+                prepare_next_ladders(grid, quantize_price(grid, refer_price), quote_balance, base_balance)
+        else:
+            for side, qty, price in ladder:
+                price = fmt(ladder_engine.from_units(price, grid.price_quantum))
+                qty = fmt(ladder_engine.from_units(qty, grid.quantity_quantum))
+                print(f"在{price}{'买入' if side == 'BUY' else '卖出'}{qty}{grid.base_asset}挂单成功")
+            if open_orders:
+                print('只读预演模式，跳过取消现有挂单')
+
+        grid.last_refer_price = quantize_price(grid, refer_price)
+        discard_terminal_order_events(grid, processed_event_order_ids)
+        prune_stale_terminal_order_events(grid)
+        prune_order_states(grid)
 
     except Exception as e:
-        defer_terminal_order_events(processed_event_order_ids)
-        print(f"更新订单时发生错误: {e}")
+        defer_terminal_order_events(grid, processed_event_order_ids)
+        clear_prepared_ladders(grid)
+        print(f"{grid.pair}更新订单时发生错误: {e}")
         traceback.print_exc()
-        send_message(f"更新订单时发生错误: {str(e)}")
+        send_message(f"{grid.pair}更新订单时发生错误: {str(e)}")
+    finally:
+        if tradingEnabled:
+            journal_grid_state(grid)
+            flush_state_journal(grid)
+        update_orders_seconds.observe(time.perf_counter() - started, grid.pair)
+
+def handle_runtime_error(e):
+    """主循环异常处理，返回需要暂停的秒数"""
+    sd_notify('WATCHDOG=1')
+    if isinstance(e, ClientError):
+        if e.status_code == 429:
+            delay = rest_rate_limiter.ban(e)
+            send_message(f"达到API速率限制，REST请求按Retry-After暂停{delay}秒")
+            return rateLimitLoopDelay
+        if e.status_code == 418:
+            delay = rest_rate_limiter.ban(e)
+            send_message(f"超出API速率限制，IP被封禁，REST请求按Retry-After暂停{delay}秒")
+            return rateLimitLoopDelay
+        send_message(f"API客户端错误\nerror_code: {e.error_code}\nerror_message: {e.error_message}")
+        return 30
+    traceback.print_exception(e)
+    send_message(f"一般错误: {str(e)}")
+    return 60
+
+def open_orders_digest(orders, excluded=()):
+    """挂单摘要：orderId -> 已成交数量，挂单集合或部分成交进度有差异都会体现出来"""
+    return {
+        int(order['orderId']): to_decimal(order['executedQty'])
+        for order in orders if int(order['orderId']) not in excluded
+    }
+
+def fetch_consistency_snapshot():
+    """并发获取账户快照和挂单；交易对较多时改用一次不带symbol的挂单查询，请求权重不再随交易对数量增长"""
+    reads = [rest_read_executor.submit(client.account)]
+    if restRequestCosts['get_open_orders'][1] * len(grids) < restUnscopedWeights['get_open_orders']:
+        reads += [rest_read_executor.submit(client.get_open_orders, symbol=grid.pair) for grid in grids]
+    else:
+        reads.append(rest_read_executor.submit(client.get_open_orders))
+    account_info, *open_order_lists = [read.result() for read in reads]
+    return account_info, [order for orders in open_order_lists for order in orders]
+
+def grid_matches_snapshot(grid, open_orders, snapshot_started_at):
+    """本地挂单摘要与交易所挂单比较；快照发出之后才有变动的订单两边都不参与比较"""
+    local_orders = live_order_states(grid)
+    changed_since = {order['orderId'] for order in local_orders if order['updateTime'] >= snapshot_started_at}
+    expected = open_orders_digest(local_orders, changed_since)
+    actual = open_orders_digest([order for order in open_orders if order['symbol'] == grid.pair], changed_since)
+    return expected == actual and grid.buy_orders | grid.sell_orders <= expected.keys() | changed_since
+
+def fetch_changed_orders(grid, since):
+    """拉取since之后有变动的订单：从本地已知的、since之前最新的订单号起按orderId向后翻页，再按updateTime过滤；
+    订单号随创建时间递增，更早的已知订单由挂单快照校准，已结束的由update_orders逐个查询"""
+    with order_states_lock:
+        known = {order_id: state['updateTime'] for order_id, state in order_states.items() if state['symbol'] == grid.pair}
+    for order_id in grid.buy_orders | grid.sell_orders:
+        known.setdefault(int(order_id), 0)
+    older = [order_id for order_id, update_time in known.items() if update_time < since]
+    start = max(older) if older else min(known, default=None)
+    params = {'orderId': start} if start is not None else {'startTime': since}
+    orders = []
+    while True:
+        page = client.get_orders(grid.pair, limit=1000, **params)
+        orders += page
+        if len(page) < 1000:
+            break
+        params = {'orderId': int(page[-1]['orderId']) + 1}
+    return [order for order in orders if int(order.get('updateTime') or 0) >= since]
+
+def verify_consistency():
+    """REST兜底对账：所有交易对共用一次账户查询和挂单查询来校验本地摘要；
+    一致时什么都不做，不一致的交易对才增量拉取变动订单并重建"""
+    snapshot_started_at = int(time.time() * 1000)
+    account_info, open_orders = fetch_consistency_snapshot()
+    if not balance_ledger_seeded:
+        apply_account_snapshot(account_info)
+    else:
+        mismatched_assets = balance_ledger_mismatches(account_info)
+        if mismatched_assets:
+            print(f"余额账本与账户快照不一致，重新校准: {', '.join(mismatched_assets)}")
+            apply_account_snapshot(account_info)
+
+    for grid in grids:
+        with grid.update_lock:
+            if grid.presumed_fills:
+                resolve_presumed_fills(grid)  # 超时的预判成交先查询确认，不能让一笔卡住的预判把整个交易对排除在对账之外
+            if grid.terminal_events or grid.presumed_fills or grid.needs_resync:
+                continue  # 有待处理的订单事件或刚发出、仍在宽限期内的预判成交，交给正常的更新流程
+            if grid_matches_snapshot(grid, open_orders, snapshot_started_at):
+                grid.last_verified_at = snapshot_started_at
+                continue
+            since = grid.last_verified_at - reconcileLookback * 1000
+        print(f'{grid.pair}本地挂单与交易所不一致，增量拉取变动订单后重建')
+        for order in fetch_changed_orders(grid, since):
+            record_order_state(order)
+        with grid.update_lock:
+            sync_open_order_states(grid, [order for order in open_orders if order['symbol'] == grid.pair], snapshot_started_at)
+            grid.last_verified_at = snapshot_started_at
+        update_orders(grid)
+
+def start_metrics_export():
+    if metricsPort:
+        metrics.start_http_server(metricsPort, metricsHost)
+        print(f'指标地址: http://{metricsHost}:{metricsPort}/metrics')
+    if metricsFilePath:
+        metrics.start_file_writer(metricsFilePath, metricsFileInterval)
+
+def prepare_startup():
+    """加载凭据、交易规则和本地状态；连接WebSocket之前的启动阶段"""
+    start_metrics_export()
+    with startup_phase('credentials'):
+        load_credentials()
+    with startup_phase('symbol filters'):
+        init_grids()
+    if tradingEnabled:
+        with startup_phase('restore state'):
+            for grid in grids:
+                restore_grid_state(grid)
+
+def main(profile_startup=False):
+    """主程序：WebSocket接收订单事件并下单撤单，REST负责兜底对账"""
+    if runtimeMode == 'asyncio':
+        asyncio.run(async_main(profile_startup))
+        return
 
-def main():
-    """主程序：WebSocket接收订单事件，REST负责下单、撤单和兜底对账"""
     print('程序启动')
     user_ws = None
     ws_started_at = 0
-    next_rest_reconcile = 0
     last_watchdog = 0
 
     try:
-        user_ws, ws_started_at = start_ready_websocket_client()
-        next_rest_reconcile = time.time() + restReconcileInterval
-
-        update_orders()
-        systemd.daemon.notify('READY=1')
+        prepare_startup()
+        with startup_phase('websocket'):
+            user_ws, ws_started_at = start_ready_websocket_client()
+        with startup_phase('initial reconcile'):
+            for grid in grids:
+                update_orders(grid, reconcile=True)
+        sd_notify('READY=1')
+        if profile_startup:
+            report_startup_profile()
+            return
+        start_market_stream()
+        next_consistency_check = time.time() + restReconcileInterval
 
         while True:
             try:
@@ -550,42 +2382,111 @@ def main():
                     ws_restart_event.clear()
                     user_ws, ws_started_at = start_ready_websocket_client(user_ws)
 
-                if order_update_event.wait(timeout=1):
+                delay = next_terminal_event_delay()
+                if order_update_event.wait(timeout=1 if delay is None else min(delay, 1)):
                     order_update_event.clear()
-                    update_orders()
-                    next_rest_reconcile = time.time() + restReconcileInterval
 
-                if has_due_terminal_order_events():
-                    update_orders()
-                    next_rest_reconcile = time.time() + restReconcileInterval
+                for grid in grids:
+                    if has_due_terminal_order_events(grid) or grid.needs_resync or has_stale_presumed_fills(grid):
+                        update_orders(grid)
 
-                if time.time() >= next_rest_reconcile:
-                    print('执行REST兜底对账')
-                    update_orders()
-                    next_rest_reconcile = time.time() + restReconcileInterval
+                if time.time() >= next_consistency_check:
+                    print('执行REST一致性校验')
+                    verify_consistency()
+                    next_consistency_check = time.time() + restReconcileInterval
 
                 if time.time() - last_watchdog >= 15:
-                    systemd.daemon.notify('WATCHDOG=1')
+                    sd_notify('WATCHDOG=1')
                     last_watchdog = time.time()
 
-            except ClientError as e:
-                systemd.daemon.notify('WATCHDOG=1')
-                if e.status_code == 429:
-                    send_message("达到API速率限制，程序暂停10分钟")
-                    time.sleep(600)
-                elif e.status_code == 418:
-                    send_message("超出API速率限制，IP被封禁，程序暂停30分钟")
-                    time.sleep(1800)
-                else:
-                    send_message(f"API客户端错误\nerror_code: {e.error_code}\nerror_message: {e.error_message}")
-                    time.sleep(30)
             except Exception as e:
-                systemd.daemon.notify('WATCHDOG=1')
-                traceback.print_exc()
-                send_message(f"一般错误: {str(e)}")
-                time.sleep(60)
+                time.sleep(handle_runtime_error(e))
     finally:
         stop_websocket_client(user_ws)
+        flush_notifications()
+
+async def async_main(profile_startup=False):
+    """asyncio运行模式：WebSocket在事件循环内收发，成交到达立即触发重建；
+    REST和网格重建在单个工作线程里串行执行，不会阻塞事件接收、对账调度和看门狗"""
+    global async_order_update
+    print('程序启动 (asyncio)')
+    event_loop = asyncio.get_running_loop()
+    order_update = asyncio.Event()
+    async_order_update = (event_loop, order_update)
+    update_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='grid-update')
+    schedule = {'wsStartedAt': 0}
+    user_ws = None
+
+    async def run_update(grid, reconcile=False):
+        await event_loop.run_in_executor(update_executor, functools.partial(update_orders, grid, reconcile))
+
+    async def fill_task():
+        while True:
+            delay = next_terminal_event_delay()
+            try:
+                await asyncio.wait_for(order_update.wait(), timeout=1 if delay is None else min(delay, 1))
+            except asyncio.TimeoutError:
+                pass
+            order_update.clear()
+            order_update_event.clear()
+            for grid in grids:
+                if has_due_terminal_order_events(grid) or grid.needs_resync or has_stale_presumed_fills(grid):
+                    await run_update(grid)
+
+    async def reconcile_task():
+        while True:
+            await asyncio.sleep(restReconcileInterval)
+            print('执行REST一致性校验')
+            await event_loop.run_in_executor(update_executor, verify_consistency)
+
+    async def watchdog_task():
+        while True:
+            sd_notify('WATCHDOG=1')
+            await asyncio.sleep(15)
+
+    async def websocket_task():
+        nonlocal user_ws
+        while True:
+            await asyncio.sleep(1)
+            if ws_restart_event.is_set() or time.time() - schedule['wsStartedAt'] >= websocketRestartInterval:
+                ws_restart_event.clear()
+                user_ws, schedule['wsStartedAt'] = await start_ready_async_websocket_client(user_ws)
+
+    async def supervised(task):
+        while True:
+            try:
+                await task()
+            except Exception as e:
+                await asyncio.sleep(handle_runtime_error(e))
+
+    try:
+        await asyncio.to_thread(prepare_startup)
+        with startup_phase('websocket'):
+            user_ws, schedule['wsStartedAt'] = await start_ready_async_websocket_client()
+        with startup_phase('initial reconcile'):
+            for grid in grids:
+                await run_update(grid, reconcile=True)
+        sd_notify('READY=1')
+        if profile_startup:
+            report_startup_profile()
+            return
+        start_market_stream()
+        await asyncio.gather(
+            supervised(fill_task),
+            supervised(reconcile_task),
+            supervised(watchdog_task),
+            supervised(websocket_task),
+        )
+    finally:
+        async_order_update = None
+        stop_websocket_client(user_ws)
+        update_executor.shutdown(wait=False)
+        await asyncio.to_thread(flush_notifications)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Binance Spot grid trading bot.')
+    parser.add_argument('--profile-startup', action='store_true', help='print time spent in each startup phase after READY and exit')
+    return parser
 
 if __name__ == "__main__":
-    main()
+    main(build_parser().parse_args().profile_startup)
@@ -0,0 +1,55 @@
+"""Exchange-agnostic grid strategy decisions.
+
+Everything here is a pure function of the grid parameters and the current grid
+state, so the same logic drives the live bot (grid.py) and the backtester
+(backtest.py).
+"""
+
+from decimal import Decimal
+
+import ladder as ladder_engine
+
+
+def floor_to_step(value, step):
+    return (Decimal(value) // step) * step
+
+
+def initial_refer_price(trade_price, price_step, tick_size):
+    """Snap a trade price to the grid: a multiple of price_step plus price_step / 2."""
+    return floor_to_step((Decimal(trade_price) // price_step * price_step) + (price_step / 2), tick_size)
+
+
+def move_refer_price(refer_price, side, price_step):
+    """A buy fill moves the reference price down one step, a sell fill up one step."""
+    return refer_price - price_step if side == 'BUY' else refer_price + price_step
+
+
+def next_buy_quantity(last_trade_side, last_trade_qty, initial_buy_quantity, buy_increment):
+    """After a buy the next buy grows by buy_increment; after a sell it resets."""
+    if last_trade_side == 'BUY':
+        return last_trade_qty + buy_increment
+    return initial_buy_quantity
+
+
+def plan_ladder(params, filters, refer_price, last_trade_side, last_trade_qty, quote_balance, base_balance, num_orders=None):
+    """Target ladder for the given state.
+
+    params holds priceStep, numOrders, initialBuyQuantity, buyIncrement and sellQuantity as Decimals;
+    filters holds price_quantum, quantity_quantum and min_notional. See ladder.build_ladder for the result.
+    """
+    initial_buy_qty = next_buy_quantity(
+        last_trade_side, last_trade_qty, params['initialBuyQuantity'], params['buyIncrement']
+    )
+    return ladder_engine.build_ladder(
+        refer_price,
+        params['priceStep'],
+        params['numOrders'] if num_orders is None else num_orders,
+        initial_buy_qty,
+        params['buyIncrement'],
+        params['sellQuantity'],
+        filters['price_quantum'],
+        filters['quantity_quantum'],
+        filters['min_notional'],
+        quote_balance,
+        base_balance,
+    )
@@ -0,0 +1,104 @@
+"""Integer-tick grid ladder engine.
+
+Prices are integer multiples of tickSize and quantities integer multiples of stepSize.
+A whole ladder is built with integer arithmetic only; Decimal strings are produced
+only when an order is submitted.
+"""
+
+from decimal import Decimal
+from itertools import accumulate
+
+
+def ratio(value, quantum):
+    """value / quantum as an exact (numerator, denominator) pair."""
+    value_num, value_den = Decimal(value).as_integer_ratio()
+    quantum_num, quantum_den = Decimal(quantum).as_integer_ratio()
+    return value_num * quantum_den, value_den * quantum_num
+
+
+def to_units(value, quantum):
+    """Floor value to a whole number of quantum units."""
+    num, den = ratio(value, quantum)
+    return num // den
+
+
+def ceil_units(value, quantum):
+    num, den = ratio(value, quantum)
+    return -(-num // den)
+
+
+def from_units(units, quantum):
+    return units * quantum
+
+
+def format_units(units, quantum):
+    return format(units * quantum, 'f')
+
+
+def rung_units(start, step, count, quantum, direction=1):
+    """floor((start + direction * (i + k) * step) / quantum) for every rung i, with k = 1 for prices
+    (first rung one step away) and k = 0 for quantities; all in integers."""
+    start_num, start_den = ratio(start, quantum)
+    step_num, step_den = ratio(step, quantum)
+    den = start_den * step_den
+    base = start_num * step_den
+    delta = direction * step_num * start_den
+    return [(base + i * delta) // den for i in range(count)]
+
+
+def allocate(costs, available):
+    """Number of leading rungs whose cumulative cost fits in available."""
+    count = 0
+    for used in accumulate(costs):
+        if used > available:
+            break
+        count += 1
+    return count
+
+
+def build_ladder(refer_price, price_step, num_orders, initial_buy_qty, buy_increment, sell_qty,
+                 tick_size, step_size, min_notional, quote_balance, base_balance):
+    """Build buy and sell rungs around refer_price.
+
+    Returns a dict with 'buy' and 'sell' lists of (price_ticks, qty_steps), the cumulative
+    quote (in tick * step units) and base (in steps) each side uses, and the rung that stopped
+    each side ('buyStop' / 'sellStop': (reason, price_ticks, qty_steps) or None), where reason is
+    'min_notional' or 'balance'.
+    """
+    notional_floor = ceil_units(min_notional, Decimal(tick_size) * Decimal(step_size)) if min_notional > 0 else None
+
+    buy_prices = rung_units(refer_price - price_step, price_step, num_orders, tick_size, direction=-1)
+    buy_qtys = rung_units(initial_buy_qty, buy_increment, num_orders, step_size)
+    buy_costs = [price * qty for price, qty in zip(buy_prices, buy_qtys)]
+    quote_units = to_units(quote_balance, Decimal(tick_size) * Decimal(step_size))
+    buy_count, buy_stop = fit_rungs(buy_prices, buy_qtys, buy_costs, buy_costs, notional_floor, quote_units)
+
+    sell_prices = rung_units(refer_price + price_step, price_step, num_orders, tick_size)
+    sell_steps = to_units(sell_qty, step_size)
+    sell_qtys = [sell_steps] * num_orders
+    sell_costs = [price * sell_steps for price in sell_prices]
+    sell_count, sell_stop = fit_rungs(sell_prices, sell_qtys, sell_costs, sell_qtys, notional_floor, to_units(base_balance, step_size))
+
+    return {
+        'buy': list(zip(buy_prices[:buy_count], buy_qtys[:buy_count])),
+        'sell': list(zip(sell_prices[:sell_count], sell_qtys[:sell_count])),
+        'quoteUsed': sum(buy_costs[:buy_count]),
+        'baseUsed': sell_steps * sell_count,
+        'buyStop': buy_stop,
+        'sellStop': sell_stop,
+    }
+
+
+def fit_rungs(prices, qtys, notionals, costs, notional_floor, available):
+    """Rungs are kept in order until one is below min notional or no longer fits the balance."""
+    limit = len(prices)
+    reason = None
+    if notional_floor is not None:
+        below = next((i for i, notional in enumerate(notionals) if notional < notional_floor), None)
+        if below is not None:
+            limit, reason = below, 'min_notional'
+    count = allocate(costs[:limit], available)
+    if count < limit:
+        reason = 'balance'
+    stop = (reason, prices[count], qtys[count]) if reason else None
+    return count, stop
@@ -0,0 +1,124 @@
+"""Pre-parse filtering and table dispatch for WebSocket frames.
+
+Binance frames carry the event type ("e") and symbol ("s") near the start of the
+payload, so a route can be picked with two substring searches on the raw text
+(with a regex fallback for JSON that is not compact). Frames
+that no handler is registered for, or that a route's gate rejects, are dropped
+without ever being parsed. Only frames that are actually handled pay for the JSON
+parse, which uses orjson when it is installed and the standard library otherwise.
+"""
+
+import json
+import re
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+loads = orjson.loads if orjson else json.loads
+
+
+class FieldPattern:
+    """Finds the first `"key":"value"` string field; str.find for compact JSON, a regex otherwise."""
+
+    def __init__(self, key):
+        self.compact = f'"{key}":"'
+        self.regex = re.compile(r'"%s"\s*:\s*"([^"]*)"' % re.escape(key))
+
+    def find(self, text, start=0):
+        """(value, end offset) of the first match at or after start, or (None, start)."""
+        index = text.find(self.compact, start)
+        if index >= 0:
+            index += len(self.compact)
+            end = text.find('"', index)
+            return text[index:end], end
+        match = self.regex.search(text, start)
+        return (match.group(1), match.end()) if match else (None, start)
+
+
+EVENT_TYPE = FieldPattern('e')
+SYMBOL = FieldPattern('s')
+
+
+def string_field(text, pattern):
+    """Value of the first string field matched by a FieldPattern, or None."""
+    return pattern.find(text)[0]
+
+
+def field_pattern(key):
+    return FieldPattern(key)
+
+
+def unwrap(message):
+    """Strip the combined-stream ("data") and WebSocket API subscription ("event") envelopes."""
+    if isinstance(message, dict) and 'data' in message:
+        message = message['data']
+    if isinstance(message, dict) and 'event' in message:
+        message = message['event']
+    return message
+
+
+class Router:
+    """Routes frames to handler(source, data) by (event type, symbol).
+
+    A route registered with symbol=None receives that event type for every symbol;
+    symbol-specific routes take precedence. A gate is called with the raw text
+    before parsing and drops the frame when it returns False. Frames without an
+    event type (WebSocket API responses) go to the response handler.
+    """
+
+    def __init__(self, on_response=None, loads=loads):
+        self.loads = loads
+        self.routes = {}
+        self.symbol_routed = set()
+        self.on_response = on_response
+        self.on_parse = None  # callback(seconds) after each full parse
+        self.on_frame = None  # callback(event_type, outcome), outcome is 'handled' or 'dropped'
+
+    def add(self, event_type, handler, symbol=None, gate=None):
+        self.routes[(event_type, symbol)] = (handler, gate)
+        if symbol is not None:
+            self.symbol_routed.add(event_type)
+
+    def clear(self):
+        self.routes.clear()
+        self.symbol_routed.clear()
+
+    def remove(self, event_type, symbol=None):
+        self.routes.pop((event_type, symbol), None)
+        if not any(key[0] == event_type and key[1] is not None for key in self.routes):
+            self.symbol_routed.discard(event_type)
+
+    def route(self, text):
+        """(event_type, (handler, gate) or None) for a raw frame; event_type is None for responses."""
+        event_type, end = (None, 0) if text.startswith('{"id"') else EVENT_TYPE.find(text)
+        if event_type is None:
+            return None, (self.on_response, None) if self.on_response else None
+        route = None
+        if event_type in self.symbol_routed:
+            route = self.routes.get((event_type, SYMBOL.find(text, end)[0]))
+        return event_type, route or self.routes.get((event_type, None))
+
+    def parse(self, text):
+        started = time.perf_counter()
+        data = unwrap(self.loads(text))
+        if self.on_parse:
+            self.on_parse(time.perf_counter() - started)
+        return data
+
+    def dispatch(self, source, message):
+        """Route one frame; returns True when a handler received it."""
+        if isinstance(message, (bytes, bytearray)):
+            message = message.decode('utf-8')
+        event_type, route = self.route(message)
+        if route is None or (route[1] is not None and not route[1](message)):
+            if self.on_frame:
+                self.on_frame(event_type or 'response', 'dropped')
+            return False
+        data = self.parse(message)
+        if self.on_frame:
+            self.on_frame(event_type or 'response', 'handled')
+        route[0](source, data)
+        return True
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""Parallel parameter sweep for the grid backtester.
+
+Price history is loaded once, saved as .npy files and memory-mapped read-only by
+every worker process, so tasks only carry a symbol and a parameter set. Each
+finished case is appended to the results CSV immediately; rerunning the same
+command skips cases that are already there, and the ranked table is rebuilt from
+the results file at the end.
+"""
+
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import Decimal
+
+import numpy as np
+
+import backtest
+
+PARAM_NAMES = ['priceStep', 'initialBuyQuantity', 'buyIncrement', 'sellQuantity']
+RESULT_FIELDS = ['key', 'symbol'] + PARAM_NAMES + [
+    'fills', 'buys', 'sells', 'realized', 'fees', 'net', 'unrealized', 'endEquity', 'returnPct', 'maxBase',
+]
+
+worker_arrays = {}
+worker_settings = {}
+
+
+def source_fingerprint(data_path, data_format):
+    """What the cached arrays were built from: the input file (path, size, mtime) and its format."""
+    stat = os.stat(data_path)
+    return {'path': os.path.abspath(data_path), 'size': stat.st_size, 'mtimeNs': stat.st_mtime_ns, 'format': data_format}
+
+
+def cache_price_history(symbol, data_path, data_format, cache_dir):
+    """Parse the CSV once and store the price path and times as .npy files for memory mapping.
+
+    A sidecar JSON records the source fingerprint; the arrays are rebuilt when the input file or
+    format changes. Returns the two array paths and a short dataset id derived from the fingerprint.
+    """
+    prices_path = os.path.join(cache_dir, f'{symbol}_prices.npy')
+    times_path = os.path.join(cache_dir, f'{symbol}_times.npy')
+    source_path = os.path.join(cache_dir, f'{symbol}_source.json')
+    source = source_fingerprint(data_path, data_format)
+    cached = None
+    if os.path.exists(source_path) and os.path.exists(prices_path) and os.path.exists(times_path):
+        with open(source_path, encoding='utf-8') as f:
+            cached = json.load(f)
+    if cached != source:
+        path_prices, times = backtest.load_klines(data_path) if data_format == 'klines' else backtest.load_trades(data_path)
+        np.save(times_path, times)
+        np.save(prices_path, path_prices)
+        with open(source_path, 'w', encoding='utf-8') as f:
+            json.dump(source, f)
+    dataset = hashlib.sha1(json.dumps(source, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return prices_path, times_path, dataset
+
+
+def init_worker(array_paths, settings):
+    for symbol, (prices_path, times_path, _) in array_paths.items():
+        worker_arrays[symbol] = (np.load(prices_path, mmap_mode='r'), np.load(times_path, mmap_mode='r'))
+    worker_settings.update(settings)
+
+
+def case_key(symbol, dataset, params):
+    """Results are keyed by dataset too, so a changed input file is never resumed from or ranked with old rows."""
+    return '|'.join([symbol, dataset] + [f'{name}={params[name]}' for name in PARAM_NAMES])
+
+
+def run_case(symbol, params):
+    path_prices, times = worker_arrays[symbol]
+    dataset = worker_settings['datasets'][symbol]
+    settings = worker_settings
+    strategy = {name: Decimal(params[name]) for name in PARAM_NAMES}
+    strategy['numOrders'] = 1
+    filters = {
+        'price_quantum': Decimal(settings['tickSize']),
+        'quantity_quantum': Decimal(settings['stepSize']),
+        'min_notional': Decimal(settings['minNotional']),
+    }
+    quote_balance = Decimal(settings['quoteBalance'])
+    base_balance = Decimal(settings['baseBalance'])
+    state, fills, _ = backtest.run_backtest(
+        path_prices, times, strategy, filters, quote_balance, base_balance, Decimal(settings['feeRate']),
+    )
+
+    first_price = Decimal(repr(float(path_prices[0])))
+    last_price = Decimal(repr(float(path_prices[-1])))
+    start_equity = quote_balance + base_balance * first_price
+    end_equity = state['quote'] + state['base'] * last_price
+    buys = sum(1 for fill in fills if fill['side'] == 'BUY')
+    return dict(
+        params,
+        key=case_key(symbol, dataset, params),
+        symbol=symbol,
+        fills=len(fills),
+        buys=buys,
+        sells=len(fills) - buys,
+        realized=f"{state['realized']:.2f}",
+        fees=f"{state['fees']:.2f}",
+        net=f"{state['realized'] - state['fees']:.2f}",
+        unrealized=f"{(last_price - state['avgCost']) * state['base']:.2f}",
+        endEquity=f'{end_equity:.2f}',
+        returnPct=f'{(end_equity / start_equity - 1) * 100:.3f}' if start_equity else '0',
+        maxBase=str(state['maxBase']),
+    )
+
+
+def load_done_keys(results_path):
+    if not os.path.exists(results_path):
+        return set()
+    with open(results_path, newline='', encoding='utf-8') as f:
+        return {row['key'] for row in csv.DictReader(f)}
+
+
+def write_ranking(results_path, ranked_path, rank_by, top, keys):
+    with open(results_path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    stale = sum(1 for row in rows if row['key'] not in keys)
+    if stale:
+        print(f'Ignoring {stale} rows in {results_path} from other datasets or parameter grids')
+    rows = [row for row in rows if row['key'] in keys]
+    rows.sort(key=lambda row: float(row[rank_by]), reverse=True)
+    with open(ranked_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=['rank'] + RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(dict(row, rank=index + 1) for index, row in enumerate(rows))
+
+    print(f'\nTop {min(top, len(rows))} of {len(rows)} by {rank_by} (full table: {ranked_path})')
+    for index, row in enumerate(rows[:top]):
+        params = ' '.join(f'{name}={row[name]}' for name in PARAM_NAMES)
+        print(f"{index + 1:>4}. {row['symbol']:<10} {params}  fills={row['fills']} net={row['net']} return={row['returnPct']}%")
+
+
+def parse_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Sweep grid parameters over price history on all CPU cores.')
+    parser.add_argument('--data', action='append', required=True, metavar='SYMBOL=CSV', help='price history per symbol, repeatable')
+    parser.add_argument('--format', choices=['klines', 'trades'], default='klines', help='data file format, default: klines')
+    parser.add_argument('--price-step', type=parse_list, required=True, help='comma-separated values')
+    parser.add_argument('--initial-buy-quantity', type=parse_list, required=True, help='comma-separated values')
+    parser.add_argument('--buy-increment', type=parse_list, required=True, help='comma-separated values')
+    parser.add_argument('--sell-quantity', type=parse_list, required=True, help='comma-separated values')
+    parser.add_argument('--tick-size', default='0.01')
+    parser.add_argument('--step-size', default='0.00001')
+    parser.add_argument('--min-notional', default='5')
+    parser.add_argument('--quote-balance', default='10000')
+    parser.add_argument('--base-balance', default='0')
+    parser.add_argument('--fee-rate', default='0.001')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes, default: CPU count')
+    parser.add_argument('--results', default='sweep_results.csv', help='streamed results, also used to resume')
+    parser.add_argument('--ranked', default='sweep_ranked.csv', help='ranked table written at the end')
+    parser.add_argument('--rank-by', choices=['net', 'endEquity', 'returnPct', 'realized', 'fills'], default='returnPct')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--cache-dir', default='sweep_cache', help='directory for memory-mapped price arrays')
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    os.makedirs(args.cache_dir, exist_ok=True)
+    array_paths = {}
+    for item in args.data:
+        symbol, data_path = item.split('=', 1)
+        array_paths[symbol] = cache_price_history(symbol, data_path, args.format, args.cache_dir)
+
+    datasets = {symbol: paths[2] for symbol, paths in array_paths.items()}
+    grid_values = [args.price_step, args.initial_buy_quantity, args.buy_increment, args.sell_quantity]
+    done = load_done_keys(args.results)
+    cases = [
+        (symbol, dict(zip(PARAM_NAMES, values)))
+        for symbol in array_paths
+        for values in itertools.product(*grid_values)
+    ]
+    keys = {case_key(symbol, datasets[symbol], params) for symbol, params in cases}
+    pending = [(symbol, params) for symbol, params in cases if case_key(symbol, datasets[symbol], params) not in done]
+    print(f'{len(cases)} cases, {len(cases) - len(pending)} already in {args.results}, running {len(pending)} on {args.workers} workers')
+
+    settings = {
+        'tickSize': args.tick_size, 'stepSize': args.step_size, 'minNotional': args.min_notional,
+        'quoteBalance': args.quote_balance, 'baseBalance': args.base_balance, 'feeRate': args.fee_rate,
+        'datasets': datasets,
+    }
+    started = time.perf_counter()
+    write_header = not os.path.exists(args.results)
+    with open(args.results, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        if write_header:
+            writer.writeheader()
+        if pending:
+            with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(array_paths, settings)) as executor:
+                futures = [executor.submit(run_case, symbol, params) for symbol, params in pending]
+                try:
+                    for completed, future in enumerate(as_completed(futures), 1):
+                        writer.writerow(future.result())
+                        f.flush()
+                        if completed % 50 == 0 or completed == len(futures):
+                            print(f'{completed}/{len(futures)} done, {time.perf_counter() - started:.1f}s')
+                except KeyboardInterrupt:
+                    for future in futures:
+                        future.cancel()
+                    print('Interrupted; rerun the same command to resume')
+                    raise
+
+    write_ranking(args.results, args.ranked, args.rank_by, args.top, keys)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())